@@ -28,7 +28,14 @@ setup(
         'setuptools',
         'Flask',
         'mako',
+        'lxml',
+        'numpy',
+        'gunicorn',
+        'futures',
     ],
     entry_points="""
+    [console_scripts]
+    presence_analyzer_server = presence_analyzer.server:main
+    presence_analyzer_report = presence_analyzer.reports:main
     """,
 )
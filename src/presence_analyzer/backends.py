@@ -0,0 +1,764 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends of presence data.
+
+Every backend answers the same questions (presence entries of a user,
+weekday stats of a user, columns and company-wide aggregates of all users)
+from its own storage; PRESENCE_BACKEND selects the one used by views.
+"""
+import contextlib
+import fcntl
+import logging
+import numpy
+import os
+import sqlite3
+import sys
+import threading
+
+from presence_analyzer.main import app
+from presence_analyzer.metrics import timed
+from presence_analyzer.snapshot import get_snapshot
+from presence_analyzer.snapshot import is_snapshot_stale
+from presence_analyzer.utils import CompanyStats
+from presence_analyzer.utils import EMPTY_WEEKDAY_STATS
+from presence_analyzer.utils import HISTOGRAM_BIN_SIZE
+from presence_analyzer.utils import OccupancyIndex
+from presence_analyzer.utils import PRESENCE_INDEX
+from presence_analyzer.utils import PresenceColumns
+from presence_analyzer.utils import UserRangeIndex
+from presence_analyzer.utils import WeekdayStats
+from presence_analyzer.utils import cache
+from presence_analyzer.utils import columns_to_dict
+from presence_analyzer.utils import complete_lines
+from presence_analyzer.utils import data_version
+from presence_analyzer.utils import file_version
+from presence_analyzer.utils import get_columns
+from presence_analyzer.utils import get_data
+from presence_analyzer.utils import get_store
+from presence_analyzer.utils import is_presence_pattern
+from presence_analyzer.utils import load_weekday_stats
+from presence_analyzer.utils import open_presence_file
+from presence_analyzer.utils import parse_presence_rows
+from presence_analyzer.utils import presence_files_version
+from presence_analyzer.utils import presence_source_paths
+from presence_analyzer.utils import seconds_since_midnight
+from presence_analyzer.utils import update_weekday_stats
+
+
+LOG = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class PresenceBackend(object):
+    """ Base class of storage backends. """
+
+    def load(self):
+        """ Loads or refreshes data of the backend. """
+        raise NotImplementedError
+
+    def user_data(self, user_id):
+        """
+        Returns presence entries of given user in get_data() format, or None
+        if the user has no presence data.
+        """
+        raise NotImplementedError
+
+    def weekday_stats(self, user_id):
+        """
+        Returns list of WeekdayStats of given user, one for every day in
+        week, or None if the user has no presence data.
+        """
+        raise NotImplementedError
+
+    def range_weekday_stats(self, user_id, date_from, date_to):
+        """
+        Returns weekday stats of given user limited to entries between given
+        dates (inclusive). Comes from cached UserRangeIndex of the user.
+        """
+        # pylint: disable=no-self-use
+        index = get_range_index(user_id, data_version())
+        return index.weekday_stats(date_from, date_to) if index else None
+
+    def columns(self):
+        """ Returns presence data of all users as PresenceColumns. """
+        raise NotImplementedError
+
+    def counters(self):
+        """
+        Returns dict of counters of loaded data: 'generation' (number of
+        loads and refreshes), 'rejected' lines and 'duplicates' dates.
+        Counters not tracked by the backend are missing.
+        """
+        # pylint: disable=no-self-use
+        return {}
+
+    def users(self):
+        """ Returns sorted ids of users with presence data. """
+        # pylint: disable=no-self-use
+        return [int(user_id) for user_id in get_all_columns().users()]
+
+    def company_stats(self, date_from, date_to):
+        """
+        Returns CompanyStats of entries between given dates (inclusive),
+        computed over cached columns of all users.
+        """
+        # pylint: disable=no-self-use
+        return CompanyStats.from_columns(get_all_columns(), date_from,
+                                         date_to)
+
+    def occupancy_index(self):
+        """
+        Returns OccupancyIndex of all entries, built from cached columns of
+        all users.
+        """
+        # pylint: disable=no-self-use
+        return OccupancyIndex.from_columns(get_all_columns())
+
+
+class MemoryBackend(PresenceBackend):
+    """ Presence data and aggregates kept in the process-wide store. """
+
+    def load(self):
+        """ Loads or refreshes the store. """
+        get_data()
+
+    def user_data(self, user_id):
+        """ Returns presence entries of given user. """
+        return get_data().get(user_id)
+
+    def weekday_stats(self, user_id):
+        """ Returns weekday stats of given user from store aggregates. """
+        get_data()
+        return get_store().aggregates.get(user_id)
+
+    def columns(self):
+        """ Returns presence data of all users as PresenceColumns. """
+        return PresenceColumns.from_data(get_data())
+
+    def counters(self):
+        """ Returns counters of the process-wide store. """
+        get_data()
+        store = get_store()
+        return {'generation': store.generation, 'rejected': store.rejected,
+                'duplicates': store.duplicates}
+
+
+class ColumnarBackend(PresenceBackend):
+    """ Presence data kept in typed arrays, see PresenceColumns. """
+
+    def load(self):
+        """ Loads the columns. """
+        get_columns()
+
+    def user_data(self, user_id):
+        """ Returns presence entries of given user. """
+        return get_columns().to_dict(user_id) or None
+
+    def weekday_stats(self, user_id):
+        """ Returns weekday stats computed with vectorized reductions. """
+        return get_columns().weekday_stats(user_id)
+
+    def columns(self):
+        """ Returns presence data of all users as PresenceColumns. """
+        return get_columns()
+
+
+class SnapshotBackend(PresenceBackend):
+    """ Memory-mapped binary snapshot, see presence_analyzer.snapshot. """
+
+    def load(self):
+        """ Opens the snapshot. """
+        get_snapshot()
+
+    def user_data(self, user_id):
+        """ Returns presence entries of given user. """
+        return get_snapshot().to_dict(user_id) or None
+
+    def weekday_stats(self, user_id):
+        """ Returns weekday stats computed from the user's records. """
+        return get_snapshot().weekday_stats(user_id)
+
+    def columns(self):
+        """ Returns presence data of all users as PresenceColumns. """
+        return get_snapshot().columns()
+
+
+class IndexedBackend(PresenceBackend):
+    """ Rows of a user read from the CSV file through per-user index. """
+
+    def load(self):
+        """ Indexes the CSV file. """
+        PRESENCE_INDEX.load(app.config['DATA_CSV'])
+
+    def user_data(self, user_id):
+        """ Returns presence entries of given user read from the file. """
+        self.load()
+        return PRESENCE_INDEX.read_user_data(user_id)
+
+    def weekday_stats(self, user_id):
+        """ Returns weekday stats folded from the user's rows. """
+        items = self.user_data(user_id)
+        if items is None:
+            return None
+        stats = [EMPTY_WEEKDAY_STATS] * 7
+        for date, item in items.iteritems():
+            update_weekday_stats(stats, date, item['start'], item['end'])
+        return stats
+
+    def counters(self):
+        """ Returns number of indexings of the CSV file. """
+        self.load()
+        return {'generation': PRESENCE_INDEX.generation}
+
+    def columns(self):
+        """ Returns presence data of all users as PresenceColumns. """
+        return get_columns()
+
+
+class StreamingBackend(IndexedBackend):
+    """ Weekday sums of all users folded while streaming the CSV file. """
+
+    def load(self):
+        """ Indexes the CSV file and streams it into weekday sums. """
+        super(StreamingBackend, self).load()
+        self.streamed_stats()
+
+    def streamed_stats(self):
+        """ Returns weekday sums of all users of current CSV file. """
+        # pylint: disable=no-self-use
+        path = app.config['DATA_CSV']
+        stat = os.stat(path)
+        return load_weekday_stats(path, stat.st_size, stat.st_mtime)
+
+    def weekday_stats(self, user_id):
+        """ Returns weekday stats of given user from streamed sums. """
+        return self.streamed_stats().get(user_id)
+
+
+SQLITE_BATCH_SIZE = 10000
+
+SQLITE_SCHEMA = '''
+    CREATE TABLE presence (
+        user_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        start_seconds INTEGER NOT NULL,
+        end_seconds INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID;
+    CREATE TABLE source (
+        version TEXT NOT NULL,
+        policy TEXT NOT NULL,
+        path TEXT NOT NULL,
+        inode INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        offset INTEGER NOT NULL,
+        rows INTEGER NOT NULL,
+        rejected INTEGER NOT NULL,
+        duplicates INTEGER NOT NULL
+    );
+'''
+
+SQLITE_INSERTS = {
+    'last': 'DO UPDATE SET start_seconds = excluded.start_seconds, '
+            'end_seconds = excluded.end_seconds',
+    'first': 'DO NOTHING',
+    'longest': 'DO UPDATE SET start_seconds = excluded.start_seconds, '
+               'end_seconds = excluded.end_seconds '
+               'WHERE excluded.end_seconds - excluded.start_seconds > '
+               'end_seconds - start_seconds',
+    'span': 'DO UPDATE SET '
+            'start_seconds = min(start_seconds, excluded.start_seconds), '
+            'end_seconds = max(end_seconds, excluded.end_seconds)',
+}
+
+
+def presence_source_version(source, policy):
+    """ Returns text identifying state of presence files and policy. """
+    if is_presence_pattern(source):
+        return repr((policy, presence_files_version(source)))
+    return repr((policy, file_version(source)))
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Holds exclusive lock of given file, created if missing, so only one
+    process at a time runs the block.
+    """
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def day_range(date_from, date_to):
+    """
+    Returns date ordinals bounding given dates (inclusive), open ends are
+    not limited.
+    """
+    return (date_from.toordinal() if date_from is not None else 0,
+            date_to.toordinal() if date_to is not None else sys.maxint)
+
+
+def read_sqlite_source(path):
+    """
+    Returns source row of SQLite database as dict, None if the database is
+    missing or unusable.
+    """
+    if not os.path.exists(path):
+        return None
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    connection.text_factory = str
+    try:
+        row = connection.execute('SELECT * FROM source').fetchone()
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        connection.close()
+    return dict(zip(row.keys(), row)) if row is not None else None
+
+
+def is_sqlite_appended(state, source, policy):
+    """
+    Checks if presence CSV file imported into SQLite database with given
+    source row only grew since, so appended lines can be imported alone.
+    """
+    if (state is None or is_presence_pattern(source) or
+            state['path'] != source or state['policy'] != policy):
+        return False
+    stat = os.stat(source)
+    return stat.st_ino == state['inode'] and stat.st_size > state['size']
+
+
+def insert_presence_lines(connection, policy, lines, counters, batch_size):
+    """
+    Inserts rows of presence CSV lines in batches, resolving dates already
+    present with given duplicates policy. Rejected lines are counted in
+    given counters dict. Returns number of parsed rows.
+    """
+    insert = ('INSERT INTO presence VALUES (?, ?, ?, ?) '
+              'ON CONFLICT (user_id, day) ' + SQLITE_INSERTS[policy])
+    parsed = 0
+    batch = []
+    for user_id, date, start, end in parse_presence_rows(lines, counters):
+        batch.append((user_id, date.toordinal(),
+                      seconds_since_midnight(start),
+                      seconds_since_midnight(end)))
+        if len(batch) == batch_size:
+            connection.executemany(insert, batch)
+            parsed += len(batch)
+            batch = []
+    connection.executemany(insert, batch)
+    return parsed + len(batch)
+
+
+def count_sqlite_rows(connection):
+    """ Returns number of presence rows in SQLite database. """
+    return connection.execute('SELECT COUNT(*) FROM presence').fetchone()[0]
+
+
+def import_presence_sqlite(source, path, policy='last',
+                           batch_size=SQLITE_BATCH_SIZE):
+    """
+    Imports presence CSV file or files matching a pattern into SQLite
+    database, inserting rows in batches. Dates present more than once are
+    resolved with given duplicates policy. Of a single CSV file only
+    complete lines are imported, lines appended later are imported by
+    append_presence_sqlite().
+
+    The database is written to a temporary file first and renamed, so
+    readers never see a partially written one. Returns numbers of imported
+    rows, rejected lines and duplicated dates.
+    """
+    if policy not in SQLITE_INSERTS:
+        raise ValueError('Unknown duplicates policy: {}'.format(policy))
+    version = presence_source_version(source, policy)
+
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.executescript(SQLITE_SCHEMA)
+        counters = {'rejected': 0}
+        parsed = 0
+        inode = size = 0
+        position = [0]
+        if is_presence_pattern(source):
+            for csv_path in presence_source_paths(source):
+                with open_presence_file(csv_path) as csvfile:
+                    parsed += insert_presence_lines(
+                        connection, policy, csvfile, counters, batch_size
+                    )
+        else:
+            stat = os.stat(source)
+            inode, size = stat.st_ino, stat.st_size
+            with open(source, 'rb') as csvfile:
+                parsed = insert_presence_lines(
+                    connection, policy, complete_lines(csvfile, position),
+                    counters, batch_size
+                )
+
+        rows = count_sqlite_rows(connection)
+        connection.execute(
+            'INSERT INTO source VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (version, policy, source, inode, size, position[0], rows,
+             counters['rejected'], parsed - rows)
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    os.rename(temp_path, path)
+    return rows, counters['rejected'], parsed - rows
+
+
+def append_presence_sqlite(source, path, batch_size=SQLITE_BATCH_SIZE):
+    """
+    Imports lines appended to presence CSV file since it was imported into
+    SQLite database (see is_sqlite_appended()) in one transaction, with the
+    duplicates policy of the database. Returns numbers of rows, rejected
+    lines and duplicated dates of the whole database.
+    """
+    connection = sqlite3.connect(path)
+    connection.text_factory = str
+    try:
+        policy, offset, rows, rejected, duplicates = connection.execute(
+            'SELECT policy, offset, rows, rejected, duplicates FROM source'
+        ).fetchone()
+        version = presence_source_version(source, policy)
+        stat = os.stat(source)
+        counters = {'rejected': rejected}
+        position = [offset]
+        with open(source, 'rb') as csvfile:
+            csvfile.seek(offset)
+            parsed = insert_presence_lines(
+                connection, policy, complete_lines(csvfile, position),
+                counters, batch_size
+            )
+
+        duplicates += parsed - (count_sqlite_rows(connection) - rows)
+        rows = count_sqlite_rows(connection)
+        connection.execute(
+            'UPDATE source SET version = ?, size = ?, offset = ?, rows = ?, '
+            'rejected = ?, duplicates = ?',
+            (version, stat.st_size, position[0], rows, counters['rejected'],
+             duplicates)
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    return rows, counters['rejected'], duplicates
+
+
+class SQLiteBackend(PresenceBackend):
+    """
+    Presence rows kept in SQLite database DATA_SQLITE, keyed by user and
+    date ordinal. Weekday stats are computed by GROUP BY queries, so memory
+    does not grow with history and all processes share one file.
+
+    The database is imported from DATA_CSV when it is missing or was made
+    from other files, lines appended to the CSV file are added to it. Every
+    thread has its own connection, reopened when the database file is
+    replaced.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.imported = None
+        self.generation = 0
+
+    def load(self):
+        """
+        Brings the database up to date with presence files. Processes
+        sharing the database update it one at a time under a lock file, so
+        whichever comes first does the work (the server does it at warm-up
+        in the master) and others find it done.
+        """
+        path = app.config['DATA_SQLITE']
+        source = app.config['DATA_CSV']
+        policy = app.config.get('DATA_DUPLICATES', 'last')
+        version = presence_source_version(source, policy)
+        if self.imported == (path, version):
+            return
+
+        with self.lock, file_lock(path + '.lock'):
+            state = read_sqlite_source(path)
+            if state is not None and state['version'] == version:
+                pass
+            elif is_sqlite_appended(state, source, policy):
+                LOG.info('Importing appended presence data into %s', path)
+                append_presence_sqlite(source, path)
+            else:
+                LOG.info('Importing presence data into %s', path)
+                import_presence_sqlite(source, path, policy)
+            self.imported = (path, version)
+            self.generation += 1
+
+    def connection(self):
+        """ Returns connection of current thread to up to date database. """
+        self.load()
+        version = file_version(app.config['DATA_SQLITE'])
+        if getattr(self.local, 'version', None) != version:
+            if getattr(self.local, 'connection', None) is not None:
+                self.local.connection.close()
+            self.local.connection = sqlite3.connect(version[0])
+            self.local.version = version
+        return self.local.connection
+
+    def user_data(self, user_id):
+        """ Returns presence entries of given user. """
+        rows = self.connection().execute(
+            'SELECT day, start_seconds, end_seconds FROM presence '
+            'WHERE user_id = ?', (user_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        return columns_to_dict(*zip(*rows))
+
+    def weekday_stats(self, user_id):
+        """ Returns weekday stats of given user summed by the database. """
+        return self.query_weekday_stats('user_id = ?', (user_id,))
+
+    def range_weekday_stats(self, user_id, date_from, date_to):
+        """ Returns weekday stats of given dates summed by the database. """
+        connection = self.connection()
+        if connection.execute('SELECT 1 FROM presence WHERE user_id = ? '
+                              'LIMIT 1', (user_id,)).fetchone() is None:
+            return None
+        return self.query_weekday_stats(
+            'user_id = ? AND day BETWEEN ? AND ?',
+            (user_id,) + day_range(date_from, date_to)
+        ) or [EMPTY_WEEKDAY_STATS] * 7
+
+    def query_weekday_stats(self, condition, parameters):
+        """
+        Returns weekday stats of rows matching given SQL condition, None if
+        there are no such rows.
+        """
+        rows = self.connection().execute(
+            'SELECT (day - 1) % 7, COUNT(*), '
+            'SUM(end_seconds - start_seconds), SUM(start_seconds), '
+            'SUM(end_seconds) FROM presence WHERE ' + condition +
+            ' GROUP BY 1', parameters
+        ).fetchall()
+        if not rows:
+            return None
+        stats = [EMPTY_WEEKDAY_STATS] * 7
+        for row in rows:
+            stats[row[0]] = WeekdayStats(*row[1:])
+        return stats
+
+    def columns(self):
+        """ Returns presence data of all users as PresenceColumns. """
+        rows = numpy.array(self.connection().execute(
+            'SELECT user_id, day, start_seconds, end_seconds FROM presence '
+            'ORDER BY user_id, day'
+        ).fetchall(), dtype=numpy.int32).reshape(-1, 4)
+        return PresenceColumns(*[rows[:, column].copy()
+                                 for column in range(4)])
+
+    def counters(self):
+        """
+        Returns counters of the database kept in its source table, and
+        number of database versions loaded by this process.
+        """
+        self.load()
+        state = read_sqlite_source(app.config['DATA_SQLITE'])
+        return {'generation': self.generation,
+                'rejected': state['rejected'],
+                'duplicates': state['duplicates']}
+
+    def users(self):
+        """ Returns sorted ids of users with presence data. """
+        return [row[0] for row in self.connection().execute(
+            'SELECT DISTINCT user_id FROM presence ORDER BY user_id'
+        )]
+
+    def company_stats(self, date_from, date_to):
+        """
+        Returns CompanyStats of entries between given dates (inclusive),
+        aggregated by the database without reading all rows.
+        """
+        bin_size = HISTOGRAM_BIN_SIZE
+        connection = self.connection()
+        days = day_range(date_from, date_to)
+        bins = -(-24 * 3600 // bin_size)
+        histograms = []
+        for column in ('start_seconds', 'end_seconds'):
+            histogram = numpy.zeros(bins, dtype=numpy.int64)
+            for slot, count in connection.execute(
+                    'SELECT ' + column + ' / ?, COUNT(*) FROM presence '
+                    'WHERE day BETWEEN ? AND ? GROUP BY 1',
+                    (bin_size,) + days):
+                histogram[slot] = count
+            histograms.append(histogram)
+        headcounts = numpy.array(connection.execute(
+            'SELECT day, COUNT(*) FROM presence WHERE day BETWEEN ? AND ? '
+            'GROUP BY day ORDER BY day', days
+        ).fetchall(), dtype=numpy.int64).reshape(-1, 2)
+        return CompanyStats(
+            self.query_weekday_stats('day BETWEEN ? AND ?', days) or
+            [EMPTY_WEEKDAY_STATS] * 7,
+            histograms[0], histograms[1], headcounts[:, 0],
+            headcounts[:, 1], bin_size
+        )
+
+    def occupancy_index(self):
+        """
+        Returns OccupancyIndex of all entries, built from numbers of entries
+        starting and ending in every slot counted by the database.
+        """
+        slot_size = HISTOGRAM_BIN_SIZE
+        changes = numpy.array(self.connection().execute(
+            'SELECT day, start_seconds / ?, COUNT(*) FROM presence '
+            'GROUP BY 1, 2 UNION ALL '
+            'SELECT day, MAX((end_seconds + ? - 1) / ?, start_seconds / ?), '
+            '-COUNT(*) FROM presence GROUP BY 1, 2',
+            (slot_size,) * 4
+        ).fetchall(), dtype=numpy.int64).reshape(-1, 3)
+        return OccupancyIndex.from_changes(changes[:, 0], changes[:, 1],
+                                           changes[:, 2], slot_size)
+
+
+BACKENDS = {
+    'memory': MemoryBackend(),
+    'columnar': ColumnarBackend(),
+    'snapshot': SnapshotBackend(),
+    'indexed': IndexedBackend(),
+    'streaming': StreamingBackend(),
+    'sqlite': SQLiteBackend(),
+}
+
+
+def get_backend():
+    """
+    Returns PRESENCE_BACKEND. Only 'memory' and 'snapshot' backends read
+    many presence files, so others fall back to 'memory' for them. Only
+    'memory' and 'sqlite' backends resolve duplicates with other
+    DATA_DUPLICATES policy than 'last', others fall back to 'memory' for it.
+    Snapshot older than the CSV file also falls back to 'memory'.
+    """
+    backend = app.config.get('PRESENCE_BACKEND')
+    if (backend not in ('memory', 'sqlite') and
+            app.config.get('DATA_DUPLICATES', 'last') != 'last'):
+        return 'memory'
+    if (backend in ('columnar', 'indexed', 'streaming') and
+            is_presence_pattern(app.config['DATA_CSV'])):
+        return 'memory'
+    if backend == 'snapshot' and is_snapshot_stale():
+        return 'memory'
+    return backend
+
+
+def get_storage():
+    """
+    Returns backend set as PRESENCE_BACKEND, the memory one for unknown
+    names.
+    """
+    return BACKENDS.get(get_backend(), BACKENDS['memory'])
+
+
+@cache(24 * 3600, max_entries=1)
+def load_all_columns(version):  # pylint: disable=unused-argument
+    """
+    Takes presence data of all users as PresenceColumns from the backend set
+    as PRESENCE_BACKEND. Data version is only a part of cache key.
+    """
+    return get_storage().columns()
+
+
+def get_all_columns():
+    """
+    Returns presence data of all users as PresenceColumns, taken from the
+    backend set as PRESENCE_BACKEND without loading the CSV file twice.
+    Columns are built once for every data version, date ranges are filtered
+    on them.
+    """
+    return load_all_columns(data_version())
+
+
+def get_user_data(user_id):
+    """
+    Returns presence entries of given user in get_data() format, or None if
+    the user has no presence data. Uses backend set as PRESENCE_BACKEND.
+    """
+    return get_storage().user_data(user_id)
+
+
+@cache(3600, max_entries=1024)
+def get_range_index(user_id, version):  # pylint: disable=unused-argument
+    """
+    Returns UserRangeIndex of given user or None if the user has no presence
+    data. Data version is only a part of cache key.
+    """
+    items = get_user_data(user_id)
+    return UserRangeIndex(items) if items is not None else None
+
+
+@timed
+def get_weekday_stats(user_id, date_from=None, date_to=None):
+    """
+    Returns list of WeekdayStats of given user, one for every day in week,
+    or None if the user has no presence data. Stats can be limited to
+    entries between given dates (inclusive).
+
+    Stats come from the backend set as PRESENCE_BACKEND: the presence store
+    aggregates ('memory'), vectorized reductions over columnar data
+    ('columnar') or memory-mapped binary snapshot ('snapshot'), the user's
+    rows read through the per-user CSV index ('indexed'), sums folded while
+    streaming the CSV file ('streaming') or GROUP BY queries over SQLite
+    database ('sqlite'). Other than SQLite backends answer date ranges from
+    cached UserRangeIndex.
+    """
+    storage = get_storage()
+    if date_from is not None or date_to is not None:
+        return storage.range_weekday_stats(user_id, date_from, date_to)
+    return storage.weekday_stats(user_id)
+
+
+@cache(24 * 3600, max_entries=32)
+def load_company_stats(version, date_from, date_to):
+    """
+    Computes CompanyStats of entries between given dates with the backend
+    set as PRESENCE_BACKEND. Data version is only a part of cache key.
+    """
+    # pylint: disable=unused-argument
+    return get_storage().company_stats(date_from, date_to)
+
+
+@timed
+def get_company_stats(date_from=None, date_to=None):
+    """
+    Returns CompanyStats of current presence data, optionally limited to
+    entries between given dates (inclusive).
+    """
+    return load_company_stats(data_version(), date_from, date_to)
+
+
+@cache(24 * 3600, max_entries=1)
+def load_occupancy_index(version):  # pylint: disable=unused-argument
+    """
+    Builds OccupancyIndex of all presence data with the backend set as
+    PRESENCE_BACKEND. Data version is only a part of cache key.
+    """
+    return get_storage().occupancy_index()
+
+
+@timed
+def get_occupancy_index():
+    """ Returns OccupancyIndex of current presence data. """
+    return load_occupancy_index(data_version())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print 'Usage: backends.py DATA_CSV DATA_SQLITE'
+        sys.exit(1)
+    print 'Imported %d presence entries, %d rejected, %d duplicated' % (
+        import_presence_sqlite(*sys.argv[1:])
+    )
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of presence analyzer.
+
+Generates synthetic presence CSV and users XML files of given scale, then
+times data loading, grouping helpers, users XML parsing and every API
+endpoint. Results are printed or saved as JSON, so they can be compared
+between releases.
+"""
+import argparse
+import datetime
+import json
+import numpy
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+from presence_analyzer import utils
+from presence_analyzer.main import app
+import presence_analyzer.views  # pylint: disable=unused-import
+
+
+def generate_presence_csv(path, users, years, seed=0):
+    """
+    Writes presence CSV file with working days of given number of users
+    over given number of years, ending yesterday. Returns number of rows.
+    """
+    rand = random.Random(seed)
+    end = datetime.date.today()
+    rows = 0
+    with open(path, 'w') as csvfile:
+        for user_id in range(10, 10 + users):
+            day = end - datetime.timedelta(days=365 * years)
+            while day < end:
+                if day.weekday() < 5:
+                    start = rand.randint(7 * 3600, 11 * 3600)
+                    duration = rand.randint(3 * 3600, 10 * 3600)
+                    csvfile.write('{},{},{},{}\n'.format(
+                        user_id, day.isoformat(),
+                        utils.seconds_to_time(start).isoformat(),
+                        utils.seconds_to_time(
+                            min(start + duration, 86399)
+                        ).isoformat(),
+                    ))
+                    rows += 1
+                day += datetime.timedelta(days=1)
+    return rows
+
+
+def generate_users_xml(path, users):
+    """ Writes users XML file with given number of users. """
+    with open(path, 'w') as xmlfile:
+        xmlfile.write(
+            '<?xml version="1.0" encoding="UTF-8" ?>\n<intranet>\n'
+            '<server><host>intranet.example.com</host><port>443</port>'
+            '<protocol>https</protocol></server>\n<users>\n'
+        )
+        for user_id in range(10, 10 + users):
+            xmlfile.write(
+                '<user id="{0}"><avatar>/api/images/users/{0}</avatar>'
+                '<name>User {0}</name></user>\n'.format(user_id)
+            )
+        xmlfile.write('</users>\n</intranet>\n')
+
+
+def peak_memory():
+    """ Returns peak resident memory of the process in kilobytes. """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(function, repeat):
+    """
+    Calls function given number of times. Returns ops/sec, median and 99th
+    percentile of call time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.time()
+        function()
+        timings.append(time.time() - started)
+    return {
+        'ops_per_sec': len(timings) / sum(timings) if sum(timings) else None,
+        'p50_ms': float(numpy.percentile(timings, 50)) * 1000,
+        'p99_ms': float(numpy.percentile(timings, 99)) * 1000,
+    }
+
+
+def get_ok(client, url):
+    """ Requests given URL, raises AssertionError unless it answers 200. """
+    response = client.get(url)
+    if response.status_code != 200:
+        raise AssertionError('{} answered {}'.format(url,
+                                                     response.status_code))
+    return response
+
+
+def run_benchmarks(users, years, repeat, work_dir):
+    """
+    Generates data files in work_dir and measures presence analyzer on them.
+    Returns dict with parameters, results of every benchmark and peak memory
+    of the process, which only grows, so it is reported once for the run.
+    """
+    csv_path = os.path.join(work_dir, 'presence.csv')
+    xml_path = os.path.join(work_dir, 'users.xml')
+    rows = generate_presence_csv(csv_path, users, years)
+    generate_users_xml(xml_path, users)
+
+    previous_config = dict((key, app.config[key])
+                           for key in ('DATA_CSV', 'DATA_XML'))
+    app.config.update({'DATA_CSV': csv_path, 'DATA_XML': xml_path})
+    try:
+        data = utils.get_data()
+        user_ids = sorted(data)
+        client = app.test_client()
+        benchmarks = [
+            ('get_data_cold', lambda: utils.PresenceStore().load(csv_path)),
+            ('get_data', utils.get_data),
+            ('group_by_weekday', lambda: [
+                utils.group_by_weekday(data[user_id]) for user_id in user_ids
+            ]),
+            ('group_by_start_end_means', lambda: [
+                utils.group_by_start_end_means(data[user_id])
+                for user_id in user_ids
+            ]),
+            ('get_users_from_xml_cold',
+             lambda: utils.UserDirectory(xml_path)),
+            ('get_users_from_xml', utils.get_users_from_xml),
+        ]
+        urls = ['/api/v1/users']
+        urls.extend(
+            '/api/v1/{}/{}'.format(endpoint, user_ids[0])
+            for endpoint in ('mean_time_weekday', 'presence_weekday',
+                             'presence_start_end', 'pictures')
+        )
+        urls.extend(
+            '/api/v1/company/{}'.format(endpoint)
+            for endpoint in ('mean_time_weekday', 'start_end_histogram',
+                             'headcount')
+        )
+        urls.extend(['/api/v1/occupancy', '/api/v1/occupancy/weekday/0'])
+        urls.append('/api/v1/batch?user_ids={}'.format(
+            ','.join(str(user_id) for user_id in user_ids)
+        ))
+        for url in urls:
+            benchmarks.append((url, lambda url=url: get_ok(client, url)))
+
+        results = dict((name, measure(function, repeat))
+                       for name, function in benchmarks)
+    finally:
+        app.config.update(previous_config)
+
+    return {
+        'params': {'users': users, 'years': years, 'rows': rows,
+                   'repeat': repeat},
+        'results': results,
+        'peak_memory_kb': peak_memory(),
+    }
+
+
+def main():
+    """ Parses command line, runs benchmarks and reports results. """
+    parser = argparse.ArgumentParser(
+        description='Presence analyzer benchmarks'
+    )
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='JSON file with results')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        report = run_benchmarks(args.users, args.years, args.repeat, work_dir)
+    finally:
+        shutil.rmtree(work_dir)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    for name, result in sorted(report['results'].items()):
+        print '{:<40} {:>10.1f} ops/s {:>9.3f} ms p50 {:>9.3f} ms p99'.format(
+            name[:40], result['ops_per_sec'] or 0, result['p50_ms'],
+            result['p99_ms']
+        )
+    print 'Peak memory: {} kB'.format(report['peak_memory_kb'])
+
+
+if __name__ == "__main__":
+    main()
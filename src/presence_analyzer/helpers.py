@@ -3,46 +3,167 @@
 Helper functions used in templates.
 """
 import ConfigParser
+import httplib
 import logging
 import os
-import urllib
+import shutil
+import tempfile
+import threading
+import urllib2
+
+from lxml import etree
 
 INI_FILENAME = os.path.join(os.path.dirname(__file__),
                             '..', '..', 'runtime', 'debug.ini')
 
 LOG = logging.getLogger(__name__)
 
+CONFIGS = {}
+
+
+def get_config(ini_file_name=INI_FILENAME):
+    """ Reads configuration file, once for every file name. """
+    if ini_file_name not in CONFIGS:
+        config = ConfigParser.ConfigParser()
+        with open(ini_file_name) as ini_file:
+            config.readfp(ini_file)
+        CONFIGS[ini_file_name] = config
+    return CONFIGS[ini_file_name]
+
 
 def get_users_xml_file(ini_file_name=INI_FILENAME):
     """ Get users xml file location from configuration file. """
-    config = ConfigParser.ConfigParser()
-    config.readfp(open(ini_file_name))
-    return config.get("users", "users_xml_file")
+    return get_config(ini_file_name).get("users", "users_xml_file")
 
 
 def get_users_url(ini_file_name=INI_FILENAME):
     """ Get users xml url address from configuration file. """
-    config = ConfigParser.ConfigParser()
-    config.readfp(open(ini_file_name))
-    return config.get("users", "users_url")
+    return get_config(ini_file_name).get("users", "users_url")
+
+
+def is_users_xml(path):
+    """ Checks if a file is a well-formed XML with users element. """
+    found = False
+    try:
+        # pylint: disable=no-member
+        for _, element in etree.iterparse(path, events=('end',)):
+            found = found or element.tag == 'users'
+            element.clear()
+    except etree.XMLSyntaxError:
+        LOG.debug("File %s is not correct XML!", path, exc_info=True)
+        return False
+    return found
+
+
+def fetch_users_xml(url, path, etag=None, last_modified=None, timeout=60):
+    """
+    Downloads users XML file if it changed since given ETag or Last-Modified
+    values. The file is streamed to a temporary file, validated and renamed,
+    so readers always see a complete one.
+
+    Returns (etag, last_modified) of the saved file, or None if the file was
+    not modified or is not correct. Network errors are raised.
+    """
+    request = urllib2.Request(url)
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if last_modified:
+        request.add_header('If-Modified-Since', last_modified)
+    try:
+        response = urllib2.urlopen(request, timeout=timeout)
+    except urllib2.HTTPError as error:
+        if error.code == 304:
+            return None
+        raise
+
+    temp_file = tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or '.',
+                                            delete=False)
+    try:
+        with temp_file:
+            try:
+                shutil.copyfileobj(response, temp_file)
+            finally:
+                response.close()
+        valid = is_users_xml(temp_file.name)
+        if valid:
+            os.chmod(temp_file.name, 0644)
+            os.rename(temp_file.name, path)
+    except Exception:
+        os.remove(temp_file.name)
+        raise
+
+    if not valid:
+        os.remove(temp_file.name)
+        return None
+    return (response.info().getheader('ETag'),
+            response.info().getheader('Last-Modified'))
 
 
 def save_users_from_www(ini_filename=INI_FILENAME):
     """ Get users xml url address from configuration file. """
     url_file = get_users_url(ini_filename)
     try:
-        with open(urllib.urlretrieve(url_file)[0]) as _file:
-            lines = _file.readlines()
-            if [line for line in lines if '<users>' in line]:
-                with open(get_users_xml_file(ini_filename), 'w') as _xfile:
-                    _xfile.writelines(lines)
-                return True
-    except (IOError, TypeError):
+        return fetch_users_xml(url_file,
+                               get_users_xml_file(ini_filename)) is not None
+    except (IOError, OSError, ValueError):
         LOG.debug("Problem during processing url %s! ",
                   url_file, exc_info=True)
     return False
 
 
+class UsersRefresher(threading.Thread):
+    """
+    Thread downloading users XML file every interval seconds. Requests are
+    conditional, so unchanged file is not transferred. After the file is
+    replaced on_refresh callback is called.
+    """
+
+    def __init__(self, url, path, interval, on_refresh=None):
+        super(UsersRefresher, self).__init__(name='users-refresher')
+        self.daemon = True
+        self.url = url
+        self.path = path
+        self.interval = interval
+        self.on_refresh = on_refresh
+        self.etag = None
+        self.last_modified = None
+        self.stopped = threading.Event()
+
+    def refresh(self):
+        """ Downloads the file once. Returns True if it was replaced. """
+        try:
+            validators = fetch_users_xml(self.url, self.path, self.etag,
+                                         self.last_modified)
+        except (IOError, OSError, ValueError, httplib.HTTPException):
+            LOG.warning("Problem during processing url %s! ",
+                        self.url, exc_info=True)
+            return False
+        if validators is None:
+            return False
+
+        self.etag, self.last_modified = validators
+        LOG.info("Users file %s refreshed", self.path)
+        if self.on_refresh is not None:
+            self.on_refresh()
+        return True
+
+    def run(self):
+        """
+        Thread activity. Errors of a refresh (also raised by on_refresh) are
+        logged and the next one is tried after interval.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception("Refreshing users file %s failed!", self.path)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        """ Stops the thread after current download. """
+        self.stopped.set()
+
+
 if __name__ == "__main__":
     if save_users_from_www():
         print 'The users file correctly saved'
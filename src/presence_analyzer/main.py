@@ -5,6 +5,7 @@ Flask app initialization.
 import os.path
 from flask import Flask
 from flask_mako import MakoTemplates
+from presence_analyzer.helpers import get_users_url
 from presence_analyzer.helpers import get_users_xml_file
 
 
@@ -12,6 +13,24 @@ MAIN_DATA_CSV = os.path.join(
     os.path.dirname(__file__), '..', '..', 'runtime', 'data', 'sample_data.csv'
 )
 
+MAIN_DATA_SNAPSHOT = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'runtime', 'data',
+    'sample_data.snapshot'
+)
+
+MAIN_DATA_SQLITE = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'runtime', 'data',
+    'sample_data.sqlite'
+)
+
+MAIN_REPORT_FILE = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'runtime', 'data', 'report.json.gz'
+)
+
+MAIN_MAKO_MODULES = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'runtime', 'mako_modules'
+)
+
 MAIN_DATA_XML = get_users_xml_file()
 
 # pylint: disable=invalid-name
@@ -19,7 +38,34 @@ app = Flask(__name__, template_folder="templates")
 app.config.update(
     DEBUG=True,
     DATA_CSV=MAIN_DATA_CSV,
-    DATA_XML=MAIN_DATA_XML
+    DATA_XML=MAIN_DATA_XML,
+    DATA_SNAPSHOT=MAIN_DATA_SNAPSHOT,
+    DATA_SQLITE=MAIN_DATA_SQLITE,
+    PRESENCE_BACKEND='memory',
+    DATA_LOAD_WORKERS=1,
+    DATA_LOAD_CHUNK_SIZE=4 * 1024 * 1024,
+    DATA_DUPLICATES='last',
+    BATCH_MAX_USERS=500,
+    JSON_CACHE_MAX_AGE=0,
+    JSON_GZIP_MIN_SIZE=1024,
+    JSON_RESPONSE_CACHE_SIZE=0,
+    WARMUP_PRERENDER=False,
+    USERS_LOCALE=None,
+    USERS_PER_PAGE=50,
+    USERS_URL=get_users_url(),
+    USERS_REFRESH_INTERVAL=0,
+    SERVER_BIND='0.0.0.0:5000',
+    SERVER_WORKERS=4,
+    SERVER_THREADS=4,
+    SERVER_RELOAD_INTERVAL=60,
+    PROFILING_ENABLED=False,
+    PROFILE_DIR=None,
+    REPORT_FILE=MAIN_REPORT_FILE,
+    REPORT_WORKDAY_HOURS=8,
+    REPORT_MAX_DAY_HOURS=12,
+    MAKO_MODULE_DIRECTORY=MAIN_MAKO_MODULES,
+    PAGE_CACHE_MAX_AGE=0,
+    SEND_FILE_MAX_AGE_DEFAULT=30 * 24 * 3600,
 )
 
 MakoTemplates().init_app(app)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Timing instrumentation of hot paths and per-request profiling.
+"""
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import time
+
+from cStringIO import StringIO
+from threading import Lock
+
+LOG = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram(object):
+    """
+    Histogram of observed values, kept separately for every combination of
+    label values, in Prometheus format.
+    """
+
+    def __init__(self, name, documentation, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.lock = Lock()
+        self.series = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value, *label_values):
+        """ Records one observed value. """
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [
+                    [0] * len(self.buckets), 0.0, 0
+                ]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        """ Returns number of observed values. """
+        return self.series.get(label_values, [None, 0.0, 0])[2]
+
+    def render(self):
+        """ Returns histogram in Prometheus text exposition format. """
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} histogram'.format(self.name)]
+        with self.lock:
+            series = sorted(self.series.items())
+        for label_values, (bucket_counts, total, count) in series:
+            labels = ['{}="{}"'.format(label, value)
+                      for label, value in zip(self.labels, label_values)]
+            for bound, bucket_count in zip(self.buckets + ('+Inf',),
+                                           bucket_counts + [count]):
+                lines.append('{}_bucket{{{}}} {}'.format(
+                    self.name, ','.join(labels + ['le="{}"'.format(bound)]),
+                    bucket_count
+                ))
+            suffix = '{{{}}}'.format(','.join(labels)) if labels else ''
+            lines.append('{}_sum{} {}'.format(self.name, suffix, repr(total)))
+            lines.append('{}_count{} {}'.format(self.name, suffix, count))
+        return '\n'.join(lines)
+
+
+FUNCTION_SECONDS = Histogram(
+    'presence_analyzer_function_seconds',
+    'Time spent in instrumented functions.',
+    labels=('function',)
+)
+
+RESPONSE_SECONDS = Histogram(
+    'presence_analyzer_response_seconds',
+    'Time spent producing JSON responses, including serialization.',
+    labels=('endpoint',)
+)
+
+
+def timed(function):
+    """ Records duration of every call of decorated function. """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        """ Inner parameters wrapper. """
+        started = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            FUNCTION_SECONDS.observe(time.time() - started, name)
+    return wrapper
+
+
+def render_metrics(gauges=()):
+    """
+    Returns all histograms and given (name, documentation, value) gauges in
+    Prometheus text exposition format.
+    """
+    parts = [histogram.render()
+             for histogram in (FUNCTION_SECONDS, RESPONSE_SECONDS)]
+    for name, documentation, value in gauges:
+        parts.append('# HELP {0} {1}\n# TYPE {0} gauge\n{0} {2}'.format(
+            name, documentation, value
+        ))
+    return '\n'.join(parts) + '\n'
+
+
+def start_profile():
+    """ Starts profiling of current thread. """
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def stop_profile(profile, name, profile_dir=None, limit=30):
+    """
+    Stops profiling and logs report of the most expensive calls. Raw profile
+    is also saved in profile_dir, if given. Returns the report.
+    """
+    profile.disable()
+    report = StringIO()
+    stats = pstats.Stats(profile, stream=report)
+    stats.sort_stats('cumulative').print_stats(limit)
+    LOG.info('Profile of %s:\n%s', name, report.getvalue())
+    if profile_dir:
+        stats.dump_stats(os.path.join(profile_dir, '{}-{}.prof'.format(
+            name.strip('/').replace('/', '_') or 'root',
+            int(time.time() * 1000)
+        )))
+    return report.getvalue()
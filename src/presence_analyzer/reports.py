@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Batch report of overtime and anomalies in presence data.
+
+The report is computed offline in one pass over all presence files and
+saved as gzip-compressed JSON, which the API serves without touching
+presence data:
+
+    python -m presence_analyzer.reports [--output REPORT_FILE]
+
+For every user it holds worked and overtime hours, hours of every ISO week,
+the longest 7-day rolling window and rows flagged as anomalies: start after
+end ('end_before_start'), missing end time ('missing_end'), day longer than
+REPORT_MAX_DAY_HOURS ('overlong') and repeated date ('duplicate').
+"""
+import argparse
+import gzip
+import json
+import logging
+import numpy
+import os
+import time
+
+from datetime import date as dt_date
+
+from presence_analyzer.main import app
+from presence_analyzer.utils import cache
+from presence_analyzer.utils import decode_presence_fields
+from presence_analyzer.utils import file_version
+from presence_analyzer.utils import open_presence_file
+from presence_analyzer.utils import presence_source_paths
+from presence_analyzer.utils import resolve_duplicate
+from presence_analyzer.utils import seconds_since_midnight
+
+
+LOG = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def scan_presence_line(line):
+    """
+    Splits presence CSV line into (user_id, date, start, end) with end None
+    when it is missing. Returns None for lines which cannot be attributed to
+    a user's date, raises ValueError for wrong values.
+    """
+    fields = line.rstrip('\r\n').split(',')
+    if len(fields) == 3 or (len(fields) == 4 and not fields[3].strip()):
+        # start stands in for the missing end, so it is decoded the same way
+        row = decode_presence_fields(fields[:3] + [fields[2]])
+        return row[:3] + (None,)
+    if len(fields) != 4:
+        return None
+    return decode_presence_fields(fields)
+
+
+class UserReport(object):
+    """ Presence days and anomalies of one user collected for the report. """
+
+    def __init__(self):
+        self.days = {}
+        self.anomalies = []
+
+    def add_anomaly(self, date, kind, start, end):
+        """ Records a flagged row. """
+        self.anomalies.append([
+            date.isoformat(), kind,
+            start.isoformat() if start is not None else None,
+            end.isoformat() if end is not None else None,
+        ])
+
+    def add(self, date, start, end, policy, max_day_seconds):
+        """ Adds one presence row, flagging anomalies. """
+        if end is None:
+            self.add_anomaly(date, 'missing_end', start, end)
+            return
+        if end < start:
+            self.add_anomaly(date, 'end_before_start', start, end)
+            return
+        seconds = seconds_since_midnight(end) - seconds_since_midnight(start)
+        if seconds > max_day_seconds:
+            self.add_anomaly(date, 'overlong', start, end)
+
+        entry = {'start': start, 'end': end}
+        day = date.toordinal()
+        previous = self.days.get(day)
+        if previous is not None:
+            self.add_anomaly(date, 'duplicate', start, end)
+            entry = resolve_duplicate(previous, entry, policy)
+        self.days[day] = entry
+
+    def summary(self, workday_seconds):
+        """ Returns report of the user. """
+        days = numpy.array(sorted(self.days), dtype=numpy.int64)
+        seconds = numpy.array([
+            seconds_since_midnight(self.days[day]['end']) -
+            seconds_since_midnight(self.days[day]['start'])
+            for day in days
+        ], dtype=numpy.int64)
+
+        weekly = []
+        max_rolling_week = 0
+        if len(days):
+            # ISO weeks start on Monday, date ordinal 1 is a Monday
+            weeks, positions = numpy.unique((days - 1) // 7,
+                                            return_inverse=True)
+            totals = numpy.bincount(positions, weights=seconds)
+            weekly = [
+                [dt_date.fromordinal(int(week) * 7 + 1).isoformat(),
+                 round(total / 3600.0, 2)]
+                for week, total in zip(weeks, totals)
+            ]
+            daily = numpy.zeros(days[-1] - days[0] + 1, dtype=numpy.int64)
+            daily[days - days[0]] = seconds
+            window = numpy.concatenate(([0], daily.cumsum()))
+            max_rolling_week = int(
+                (window[min(7, len(daily)):] -
+                 window[:len(window) - min(7, len(daily))]).max()
+            )
+
+        overtime = numpy.maximum(seconds - workday_seconds, 0).sum()
+        return {
+            'days': len(days),
+            'hours': round(seconds.sum() / 3600.0, 2),
+            'overtime_hours': round(overtime / 3600.0, 2),
+            'max_rolling_week_hours': round(max_rolling_week / 3600.0, 2),
+            'weekly_hours': weekly,
+            'anomalies': self.anomalies,
+        }
+
+
+def build_report(source, policy='last', workday_hours=8, max_day_hours=12):
+    """
+    Streams presence files named by source (see is_presence_pattern()) once
+    and returns the report dict. Dates present more than once are resolved
+    with given duplicates policy.
+    """
+    users = {}
+    rejected = 0
+    rows = 0
+    paths = presence_source_paths(source)
+    for path in paths:
+        with open_presence_file(path) as csvfile:
+            for i, line in enumerate(csvfile):
+                try:
+                    row = scan_presence_line(line)
+                except ValueError:
+                    row = None
+                if row is None:
+                    if line.strip():
+                        LOG.debug('Problem with line %d of %s', i, path)
+                        rejected += 1
+                    continue
+
+                rows += 1
+                user_id, date, start, end = row
+                if user_id not in users:
+                    users[user_id] = UserReport()
+                users[user_id].add(date, start, end, policy,
+                                   max_day_hours * 3600)
+
+    user_reports = dict(
+        (str(user_id), user.summary(workday_hours * 3600))
+        for user_id, user in users.iteritems()
+    )
+    anomalies = {}
+    for report in user_reports.itervalues():
+        for anomaly in report['anomalies']:
+            anomalies[anomaly[1]] = anomalies.get(anomaly[1], 0) + 1
+    return {
+        'generated': time.time(),
+        'sources': [os.path.basename(path) for path in paths],
+        'params': {'policy': policy, 'workday_hours': workday_hours,
+                   'max_day_hours': max_day_hours},
+        'summary': {'rows': rows, 'rejected': rejected,
+                    'users': len(user_reports), 'anomalies': anomalies},
+        'users': user_reports,
+    }
+
+
+def write_report(report, path):
+    """
+    Saves report as gzip-compressed JSON. The file is written to a temporary
+    file first and renamed, so readers never see a partially written one.
+    """
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with gzip.open(temp_path, 'wb') as report_file:
+        json.dump(report, report_file, separators=(',', ':'), sort_keys=True)
+    os.rename(temp_path, path)
+
+
+@cache(24 * 3600, max_entries=1)
+def load_report(path, version):  # pylint: disable=unused-argument
+    """ Reads saved report. File version is only a part of cache key. """
+    with gzip.open(path, 'rb') as report_file:
+        return json.load(report_file)
+
+
+def get_report():
+    """ Returns report saved as REPORT_FILE, None if there is none. """
+    path = app.config['REPORT_FILE']
+    try:
+        version = file_version(path)
+    except OSError:
+        return None
+    return load_report(path, version)
+
+
+def main():
+    """ Parses command line, computes report and saves it. """
+    parser = argparse.ArgumentParser(
+        description='Presence overtime and anomalies report'
+    )
+    parser.add_argument('--source', default=app.config['DATA_CSV'],
+                        help='presence CSV file, directory or glob pattern')
+    parser.add_argument('--output', default=app.config['REPORT_FILE'])
+    parser.add_argument('--workday-hours', type=float,
+                        default=app.config['REPORT_WORKDAY_HOURS'])
+    parser.add_argument('--max-day-hours', type=float,
+                        default=app.config['REPORT_MAX_DAY_HOURS'])
+    args = parser.parse_args()
+
+    report = build_report(args.source, app.config['DATA_DUPLICATES'],
+                          args.workday_hours, args.max_day_hours)
+    write_report(report, args.output)
+    summary = report['summary']
+    print 'Saved report of %d users, %d rows, %d rejected, anomalies: %s' % (
+        summary['users'], summary['rows'], summary['rejected'],
+        summary['anomalies']
+    )
+
+
+if __name__ == "__main__":
+    main()
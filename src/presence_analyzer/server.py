@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Production server running the app under gunicorn.
+
+Presence data and users directory are loaded and aggregates (optionally
+also JSON responses) precomputed in the master process before workers are
+forked, so workers share them copy-on-write and start ready. A watcher thread
+in the master loads new data when files change and gracefully replaces
+the workers, which then start with the new data.
+"""
+import argparse
+import logging
+import logging.config
+import os
+import signal
+import threading
+
+from gunicorn.app.base import BaseApplication
+
+from presence_analyzer.helpers import INI_FILENAME
+from presence_analyzer.main import app
+from presence_analyzer.utils import data_version
+from presence_analyzer.utils import file_version
+from presence_analyzer.utils import set_users_locale
+from presence_analyzer.utils import start_users_refresher
+from presence_analyzer.warmup import warm_up
+import presence_analyzer.views  # pylint: disable=unused-import
+
+
+LOG = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def current_version():
+    """ Returns versions of presence and users data, None if unreadable. """
+    try:
+        return data_version(), file_version(app.config['DATA_XML'])
+    except OSError:
+        return None
+
+
+class DataWatcher(threading.Thread):
+    """
+    Thread checking data files every interval seconds and calling on_change
+    callback when their version changes. The callback returns False if the
+    change could not be applied, it is then retried on the next check.
+    """
+
+    def __init__(self, interval, on_change):
+        super(DataWatcher, self).__init__(name='data-watcher')
+        self.daemon = True
+        self.interval = interval
+        self.on_change = on_change
+        self.version = current_version()
+        self.stopped = threading.Event()
+
+    def check(self):
+        """ Calls on_change if data changed. Returns True if it did. """
+        version = current_version()
+        if version == self.version:
+            return False
+        previous, self.version = self.version, version
+        if not self.on_change():
+            self.version = previous
+        return True
+
+    def run(self):
+        """ Thread activity. """
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        """ Stops the thread. """
+        self.stopped.set()
+
+
+def reload_workers():
+    """
+    Loads new data in the master and gracefully replaces workers. Workers
+    serving old data are kept if the warm-up failed. Returns True if they
+    were replaced.
+    """
+    LOG.info('Data changed, reloading workers')
+    if not warm_up():
+        LOG.warning('Warm-up failed, keeping old workers')
+        return False
+    os.kill(os.getpid(), signal.SIGHUP)
+    return True
+
+
+def when_ready(server):  # pylint: disable=unused-argument
+    """ Gunicorn hook run in the master once it is ready. """
+    interval = app.config['SERVER_RELOAD_INTERVAL']
+    if interval:
+        DataWatcher(interval, reload_workers).start()
+    start_users_refresher()
+
+
+class PresenceAnalyzerServer(BaseApplication):
+    """ Gunicorn application serving presence analyzer. """
+
+    def __init__(self, options=None):
+        self.options = options or {}
+        super(PresenceAnalyzerServer, self).__init__()
+
+    def load_config(self):
+        """ Applies server options to gunicorn configuration. """
+        threads = self.options.get('threads', app.config['SERVER_THREADS'])
+        settings = {
+            'bind': self.options.get('bind', app.config['SERVER_BIND']),
+            'workers': self.options.get('workers',
+                                        app.config['SERVER_WORKERS']),
+            'threads': threads,
+            'worker_class': 'gthread' if threads > 1 else 'sync',
+            'preload_app': True,
+            'when_ready': when_ready,
+        }
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        """ Loads the app and its data in the master process. """
+        app.config['DEBUG'] = False
+        set_users_locale()
+        warm_up()
+        return app
+
+
+def main():
+    """ Parses command line and runs the server. """
+    parser = argparse.ArgumentParser(description='Presence analyzer server')
+    parser.add_argument('--bind', help='address to listen on, host:port')
+    parser.add_argument('--workers', type=int, help='number of processes')
+    parser.add_argument('--threads', type=int,
+                        help='number of threads in every process')
+    parser.add_argument('--reload-interval', type=int,
+                        help='seconds between data checks, 0 disables')
+    parser.add_argument('--ini', default=INI_FILENAME,
+                        help='logging configuration file')
+    args = parser.parse_args()
+
+    logging.config.fileConfig(args.ini, disable_existing_loggers=False)
+    if args.reload_interval is not None:
+        app.config['SERVER_RELOAD_INTERVAL'] = args.reload_interval
+    options = dict((key, value) for key, value in vars(args).items()
+                   if key in ('bind', 'workers', 'threads') and
+                   value is not None)
+    PresenceAnalyzerServer(options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Binary snapshot of presence data.
+
+Snapshot file consists of a header, a table of users with offsets of their
+records and fixed-width presence records sorted by user and date. Loaded
+snapshot is memory-mapped read-only, so processes reading the same file
+share one page-cached copy and a single user lookup touches only the
+records of that user.
+"""
+import logging
+import numpy
+import os
+import sys
+
+from presence_analyzer.main import app
+from presence_analyzer.utils import PresenceColumns
+from presence_analyzer.utils import cache
+from presence_analyzer.utils import columns_to_dict
+from presence_analyzer.utils import is_presence_pattern
+from presence_analyzer.utils import parse_presence_rows
+from presence_analyzer.utils import vectorized_weekday_stats
+
+
+LOG = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+MAGIC = 'PRESNAP1'
+
+HEADER_DTYPE = numpy.dtype([
+    ('magic', 'S8'),
+    ('users', '<u4'),
+    ('records', '<u4'),
+    ('source_size', '<u8'),
+    ('source_mtime', '<f8'),
+])
+
+USER_DTYPE = numpy.dtype([
+    ('user_id', '<i4'),
+    ('offset', '<u4'),
+    ('count', '<u4'),
+])
+
+RECORD_DTYPE = numpy.dtype([
+    ('day', '<i4'),
+    ('start', '<i4'),
+    ('end', '<i4'),
+])
+
+
+def write_snapshot(csv_path, snapshot_path):
+    """
+    Converts presence CSV file into binary snapshot. The snapshot is written
+    to a temporary file first and renamed, so readers never see a partially
+    written one.
+    """
+    stat = os.stat(csv_path)
+    with open(csv_path, 'rb') as csvfile:
+        columns = PresenceColumns.from_rows(parse_presence_rows(csvfile))
+
+    user_ids, offsets, counts = numpy.unique(
+        columns.user_ids, return_index=True, return_counts=True
+    )
+    header = numpy.zeros(1, dtype=HEADER_DTYPE)
+    header[0] = (MAGIC, len(user_ids), len(columns),
+                 stat.st_size, stat.st_mtime)
+    users = numpy.zeros(len(user_ids), dtype=USER_DTYPE)
+    users['user_id'] = user_ids
+    users['offset'] = offsets
+    users['count'] = counts
+    records = numpy.zeros(len(columns), dtype=RECORD_DTYPE)
+    records['day'] = columns.days
+    records['start'] = columns.starts
+    records['end'] = columns.ends
+
+    temp_path = '{}.{}.tmp'.format(snapshot_path, os.getpid())
+    with open(temp_path, 'wb') as snapshot_file:
+        for part in (header, users, records):
+            snapshot_file.write(part.tostring())
+    os.rename(temp_path, snapshot_path)
+    return len(user_ids), len(columns)
+
+
+class PresenceSnapshot(object):
+    """ Read-only memory-mapped presence snapshot. """
+
+    def __init__(self, path):
+        header = numpy.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header[0]['magic'] != MAGIC:
+            raise ValueError('{} is not a presence snapshot'.format(path))
+
+        self.path = path
+        self.source_size = int(header[0]['source_size'])
+        self.source_mtime = float(header[0]['source_mtime'])
+        user_count = int(header[0]['users'])
+        record_count = int(header[0]['records'])
+        self.users = numpy.memmap(path, dtype=USER_DTYPE, mode='r',
+                                  offset=HEADER_DTYPE.itemsize,
+                                  shape=(user_count,))
+        records_offset = (HEADER_DTYPE.itemsize +
+                          USER_DTYPE.itemsize * user_count)
+        if record_count:
+            self.records = numpy.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                                        offset=records_offset,
+                                        shape=(record_count,))
+        else:
+            self.records = numpy.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def is_stale(self, csv_path):
+        """ Checks if given CSV file changed since the snapshot was made. """
+        stat = os.stat(csv_path)
+        return (stat.st_size != self.source_size or
+                stat.st_mtime != self.source_mtime)
+
+    def user_ids(self):
+        """ Returns sorted array of user ids. """
+        return self.users['user_id']
+
+    def user_records(self, user_id):
+        """ Returns records of given user, None for an unknown user. """
+        index = int(numpy.searchsorted(self.users['user_id'], user_id))
+        if (index == len(self.users) or
+                self.users[index]['user_id'] != user_id):
+            return None
+        offset = int(self.users[index]['offset'])
+        return self.records[offset:offset + int(self.users[index]['count'])]
+
+    def weekday_stats(self, user_id):
+        """
+        Returns list of WeekdayStats of given user, or None if the user has
+        no presence data.
+        """
+        records = self.user_records(user_id)
+        if records is None:
+            return None
+        return vectorized_weekday_stats(records['day'], records['start'],
+                                        records['end'])
+
+    def columns(self):
+        """ Returns all records as PresenceColumns. """
+        return PresenceColumns(
+            numpy.repeat(self.users['user_id'], self.users['count']),
+            self.records['day'], self.records['start'], self.records['end']
+        )
+
+    def to_dict(self, user_id):
+        """ Returns presence entries of given user in get_data() format. """
+        records = self.user_records(user_id)
+        if records is None:
+            return {}
+        return columns_to_dict(records['day'], records['start'],
+                               records['end'])
+
+
+@cache(24 * 3600, max_entries=1)
+def load_snapshot(path, size, mtime):  # pylint: disable=unused-argument
+    """
+    Opens presence snapshot. Size and modification time of the file are only
+    a part of cache key.
+    """
+    return PresenceSnapshot(path)
+
+
+def get_snapshot():
+    """ Returns presence snapshot configured as DATA_SNAPSHOT. """
+    path = app.config['DATA_SNAPSHOT']
+    stat = os.stat(path)
+    return load_snapshot(path, stat.st_size, stat.st_mtime)
+
+
+@cache(24 * 3600, max_entries=1)
+def check_snapshot(path, size, mtime, csv_path, csv_size, csv_mtime):
+    """
+    Checks if presence snapshot was made from other state of given CSV file
+    and logs a warning if it was. Sizes and modification times of the files
+    are only a part of cache key, so the warning is logged once for every
+    state of them.
+    """
+    # pylint: disable=too-many-arguments, unused-argument
+    stale = load_snapshot(path, size, mtime).is_stale(csv_path)
+    if stale:
+        LOG.warning('Snapshot %s is older than %s, using memory backend '
+                    'until it is written again', path, csv_path)
+    return stale
+
+
+def is_snapshot_stale():
+    """
+    Checks if DATA_SNAPSHOT is older than DATA_CSV, see check_snapshot().
+    Many presence files are not checked, a missing CSV file or unreadable
+    snapshot are not stale.
+    """
+    csv_path = app.config['DATA_CSV']
+    if is_presence_pattern(csv_path):
+        return False
+    path = app.config['DATA_SNAPSHOT']
+    try:
+        stat = os.stat(path)
+        csv_stat = os.stat(csv_path)
+        return check_snapshot(path, stat.st_size, stat.st_mtime, csv_path,
+                              csv_stat.st_size, csv_stat.st_mtime)
+    except (OSError, ValueError):
+        return False
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print 'Usage: snapshot.py DATA_CSV DATA_SNAPSHOT'
+        sys.exit(1)
+    print 'Saved %d users and %d presence entries' % write_snapshot(
+        *sys.argv[1:]
+    )
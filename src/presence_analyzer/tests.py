@@ -3,17 +3,31 @@
 Presence analyzer unit tests.
 """
 
+import BaseHTTPServer
 import datetime
+import gzip
 import json
+import locale
 import os.path
+import shutil
+import tempfile
 import threading
 import time
 import unittest
 
+from cStringIO import StringIO
+
+from presence_analyzer import backends
+from presence_analyzer import benchmark
 from presence_analyzer import helpers
 from presence_analyzer import main
+from presence_analyzer import metrics
+from presence_analyzer import reports
+from presence_analyzer import server
+from presence_analyzer import snapshot
 from presence_analyzer import utils
 from presence_analyzer import views  # pylint: disable=unused-import
+from presence_analyzer import warmup
 
 
 TEST_DATA_CSV = os.path.join(
@@ -56,7 +70,28 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
         self.assertEqual(resp.content_type, 'application/json')
         data = json.loads(resp.data)
         self.assertEqual(len(data), 3)
-        self.assertDictEqual(data[0], {u'user_id': 10, u'name': u'name 10'})
+        self.assertDictEqual(data[0], {u'user_id': 10, u'name': u'User 10'})
+
+    def test_api_users_search(self):
+        """ Test searching and paging of users listing. """
+        resp = self.client.get('/api/v1/users?q=user%201')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([item['user_id'] for item in json.loads(resp.data)],
+                         [10, 11, 13])
+        resp = self.client.get('/api/v1/users?q=USER 11')
+        self.assertEqual(json.loads(resp.data),
+                         [{u'user_id': 11, u'name': u'User 11'}])
+        resp = self.client.get('/api/v1/users?q=x')
+        self.assertEqual(json.loads(resp.data), [])
+
+        resp = self.client.get('/api/v1/users?page=2&per_page=2')
+        self.assertEqual(json.loads(resp.data),
+                         [{u'user_id': 13, u'name': u'User 13'}])
+        resp = self.client.get('/api/v1/users?q=user&per_page=1')
+        self.assertEqual(json.loads(resp.data),
+                         [{u'user_id': 10, u'name': u'User 10'}])
+        resp = self.client.get('/api/v1/users?page=0')
+        self.assertEqual(resp.status_code, 400)
 
     def test_mean_time_weekday(self):
         """ Test mean time weekday. """
@@ -106,6 +141,410 @@ class PresenceAnalyzerViewsTestCase(unittest.TestCase):
         resp = self.client.get('/static/presence_start_end.html')
         self.assertEqual(resp.status_code, 200)
 
+    def test_pages(self):
+        """ Test cached rendering of pages and static files caching. """
+        hits = utils.load_page.cache_info()['hits']
+        resp = self.client.get('/static/presence_weekday.html')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'text/html; charset=utf-8')
+        self.assertIn('/static/js/commons.js?v=', resp.data)
+        self.assertIn(utils.static_url('css/commons.css'), resp.data)
+        etag = resp.get_etag()[0]
+
+        resp = self.client.get('/static/presence_weekday.html',
+                               headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(utils.load_page.cache_info()['hits'], hits + 1)
+        resp = self.client.get('/static/mean_time_weekday.html',
+                               headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+
+        module_dir = main.app.config['MAKO_MODULE_DIRECTORY']
+        self.assertTrue(any(name.endswith('.py')
+                            for name in os.listdir(module_dir)))
+
+        resp = self.client.get('/static/css/commons.css')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.cache_control.max_age, 30 * 24 * 3600)
+        resp.close()
+
+    def test_date_range(self):
+        """ Test limiting weekday views to a range of dates. """
+        resp = self.client.get('/api/v1/presence_weekday/11?from=2013-09-10')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data[1], [u'Mon', 0])
+        self.assertEqual(data[2], [u'Tue', 16564])
+
+        resp = self.client.get(
+            '/api/v1/mean_time_weekday/11?from=2013-09-10&to=2013-09-10'
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)[1], [u'Tue', 16564])
+
+        resp = self.client.get(
+            '/api/v1/presence_start_end/11?from=2014-01-01'
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)[0],
+                         [u'Mon', [0, 0, 0], [0, 0, 0]])
+
+        resp = self.client.get('/api/v1/presence_weekday/12?from=2013-09-10')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get('/api/v1/presence_weekday/11?to=2013-13-10')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_batch(self):
+        """ Test stats of many users at once. """
+        resp = self.client.get('/api/v1/batch?user_ids=11,12')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content_type, 'application/json')
+        data = json.loads(resp.data)
+        self.assertEqual([item['user_id'] for item in data], [11, 12])
+        for name in ('mean_time_weekday', 'presence_weekday',
+                     'presence_start_end'):
+            resp = self.client.get('/api/v1/%s/11' % name)
+            self.assertEqual(data[0][name], json.loads(resp.data))
+            self.assertIsNone(data[1][name])
+        self.assertEqual(
+            data[0]['picture'],
+            json.loads(self.client.get('/api/v1/pictures/11').data)
+        )
+        self.assertEqual(data[1]['picture'], None)
+
+        resp = self.client.post('/api/v1/batch?from=2013-09-10',
+                                data=json.dumps({'user_ids': [11]}),
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)[0]['presence_weekday'][1],
+                         [u'Mon', 0])
+
+        self.assertEqual(self.client.get('/api/v1/batch').status_code, 400)
+        resp = self.client.get('/api/v1/batch?user_ids=1,a')
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.post('/api/v1/batch', data='{"user_ids": 1}',
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        for payload in ('[10]', '{"user_ids": [10.7]}',
+                        '{"user_ids": [true]}', '{"user_ids": [[10]]}'):
+            resp = self.client.post('/api/v1/batch', data=payload,
+                                    content_type='application/json')
+            self.assertEqual(resp.status_code, 400)
+
+    def test_conditional_get(self):
+        """ Test validators and conditional requests of JSON responses. """
+        resp = self.client.get('/api/v1/presence_weekday/11')
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+        self.assertIn('public', resp.headers['Cache-Control'])
+        self.assertIn('Last-Modified', resp.headers)
+        self.assertNotEqual(
+            self.client.get('/api/v1/presence_weekday/10').headers['ETag'],
+            etag
+        )
+        self.assertNotEqual(
+            self.client.get('/api/v1/mean_time_weekday/11').headers['ETag'],
+            etag
+        )
+
+        resp = self.client.get('/api/v1/presence_weekday/11',
+                               headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, '')
+        self.assertEqual(resp.headers['ETag'], etag)
+        resp = self.client.get('/api/v1/presence_weekday/11?from=2013-09-10',
+                               headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+
+        last_modified = self.client.get('/api/v1/users').headers[
+            'Last-Modified'
+        ]
+        resp = self.client.get('/api/v1/users',
+                               headers={'If-Modified-Since': last_modified})
+        self.assertEqual(resp.status_code, 304)
+        resp = self.client.get(
+            '/api/v1/users',
+            headers={'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'}
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    def test_gzip(self):
+        """ Test compression of large JSON responses. """
+        main.app.config.update({'JSON_GZIP_MIN_SIZE': 10})
+        try:
+            resp = self.client.get('/api/v1/presence_weekday/11',
+                                   headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertTrue(resp.headers['ETag'].endswith('-gzip"'))
+            data = gzip.GzipFile(fileobj=StringIO(resp.data)).read()
+            self.assertEqual(
+                json.loads(data),
+                json.loads(self.client.get('/api/v1/presence_weekday/11').data)
+            )
+
+            # weak validator, e.g. set by a proxy, still matches
+            resp = self.client.get(
+                '/api/v1/presence_weekday/11',
+                headers={'If-None-Match': 'W/' + resp.headers['ETag']}
+            )
+            self.assertEqual(resp.status_code, 304)
+
+            resp = self.client.get(
+                '/api/v1/presence_weekday/11',
+                headers={'Accept-Encoding': 'gzip;q=0, identity'}
+            )
+            self.assertNotIn('Content-Encoding', resp.headers)
+        finally:
+            main.app.config.update({'JSON_GZIP_MIN_SIZE': 1024})
+        resp = self.client.get('/api/v1/presence_weekday/11',
+                               headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_company(self):
+        """ Test company-wide aggregate views. """
+        resp = self.client.get('/api/v1/company/headcount')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data), [
+            [u'Date', u'Users'], [u'2013-09-05', 1], [u'2013-09-09', 1],
+            [u'2013-09-10', 2], [u'2013-09-11', 2], [u'2013-09-12', 2],
+            [u'2013-09-13', 1],
+        ])
+
+        resp = self.client.get('/api/v1/company/start_end_histogram')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 1 + 24 * 4)
+        self.assertEqual(data[0], [u'Time', u'Starts', u'Ends'])
+        self.assertEqual(data[1], [u'00:00', 0, 0])
+        self.assertEqual(data[1 + 9 * 4 + 1], [u'09:15', 3, 0])
+        self.assertEqual(sum(item[1] for item in data[1:]), 9)
+        self.assertEqual(sum(item[2] for item in data[1:]), 9)
+
+        resp = self.client.get('/api/v1/company/mean_time_weekday')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data[0], [u'Mon', 24123])
+        self.assertEqual(data[5], [u'Sat', 0])
+
+        resp = self.client.get(
+            '/api/v1/company/presence_start_end?from=2013-09-10&to=2013-09-10'
+        )
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data[0], [u'Mon', [0, 0, 0], [0, 0, 0]])
+        self.assertEqual(data[1], [u'Tue', [9, 29, 27], [15, 57, 53]])
+
+        resp = self.client.get('/api/v1/company/headcount?from=2013-13-10')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_presence_files_views(self):
+        """ Test views reading presence data from many files. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            main.app.config.update({'DATA_CSV': temp_dir})
+            resp = self.client.get('/api/v1/users')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.last_modified,
+                             datetime.datetime.utcfromtimestamp(
+                                 int(os.stat(TEST_DATA_XML).st_mtime)
+                             ))
+            resp = self.client.get('/api/v1/presence_weekday/10')
+            self.assertEqual(resp.status_code, 404)
+
+            shutil.copy(TEST_DATA_CSV, os.path.join(temp_dir, '2013-09.csv'))
+            gzip_path = os.path.join(temp_dir, '2013-10.csv.gz')
+            with gzip.open(gzip_path, 'wb') as csvfile:
+                csvfile.write('10,2013-10-01,08:00:00,16:00:00\n')
+            os.utime(gzip_path, (2 * 10 ** 9, 2 * 10 ** 9))
+
+            resp = self.client.get('/api/v1/presence_weekday/10')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.last_modified,
+                             datetime.datetime.utcfromtimestamp(2 * 10 ** 9))
+            resp = self.client.get(
+                '/api/v1/presence_weekday/10',
+                headers={'If-None-Match': resp.headers['ETag']}
+            )
+            self.assertEqual(resp.status_code, 304)
+            resp = self.client.get('/api/v1/company/headcount')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(json.loads(resp.data)[-1], [u'2013-10-01', 1])
+        finally:
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV})
+            shutil.rmtree(temp_dir)
+
+    def test_occupancy(self):
+        """ Test occupancy views. """
+        resp = self.client.get('/api/v1/occupancy')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(len(data), 7)
+        self.assertEqual(data[0][:3], [u'Date', u'00:00', u'00:15'])
+        self.assertEqual(len(data[0]), 1 + 24 * 4)
+        self.assertEqual(data[3][0], u'2013-09-10')
+        # 09:15 - 09:30 slot, user 10 comes at 09:39
+        self.assertEqual(data[3][1 + 9 * 4 + 1], 1)
+        self.assertEqual(data[3][1 + 9 * 4 + 2], 2)
+        self.assertEqual(data[3][1 + 14 * 4], 1)
+
+        resp = self.client.get(
+            '/api/v1/occupancy?from=2013-09-11&to=2013-09-12'
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([row[0] for row in json.loads(resp.data)[1:]],
+                         [u'2013-09-11', u'2013-09-12'])
+
+        resp = self.client.get('/api/v1/occupancy/weekday/1')
+        self.assertEqual(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEqual(data[0], [u'Time', u'Mean', u'Max'])
+        self.assertEqual(data[1 + 9 * 4 + 2], [u'09:30', 2, 2])
+        self.assertEqual(data[1 + 14 * 4], [u'14:00', 1, 1])
+
+        resp = self.client.get('/api/v1/occupancy/weekday/5')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)[1 + 10 * 4], [u'10:00', 0, 0])
+
+        resp = self.client.get('/api/v1/occupancy/weekday/7')
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get('/api/v1/occupancy?to=2013-13-10')
+        self.assertEqual(resp.status_code, 400)
+
+    def test_response_cache(self):
+        """ Test caching of encoded JSON responses. """
+        main.app.config.update({'JSON_RESPONSE_CACHE_SIZE': 2})
+        utils.RESPONSE_CACHE.clear()
+        try:
+            calls = metrics.FUNCTION_SECONDS.count('get_weekday_stats')
+            resp = self.client.get('/api/v1/presence_weekday/10')
+            self.assertEqual(len(utils.RESPONSE_CACHE), 1)
+            cached = self.client.get('/api/v1/presence_weekday/10')
+            self.assertEqual(cached.data, resp.data)
+            self.assertEqual(cached.get_etag(), resp.get_etag())
+            self.assertEqual(
+                metrics.FUNCTION_SECONDS.count('get_weekday_stats'),
+                calls + 1
+            )
+
+            self.client.post('/api/v1/batch', data=json.dumps({
+                'user_ids': [10],
+            }), content_type='application/json')
+            self.assertEqual(len(utils.RESPONSE_CACHE), 1)
+            self.assertEqual(
+                self.client.get('/api/v1/presence_weekday/12').status_code,
+                404
+            )
+            self.assertEqual(len(utils.RESPONSE_CACHE), 1)
+
+            resp = self.client.get('/api/v1/occupancy',
+                                   headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(len(utils.RESPONSE_CACHE), 2)
+            self.assertIsNotNone(
+                utils.RESPONSE_CACHE.get(resp.get_etag()[0])
+            )
+            self.assertIsNone(utils.RESPONSE_CACHE.get(cached.get_etag()[0]))
+        finally:
+            main.app.config.update({'JSON_RESPONSE_CACHE_SIZE': 0})
+            utils.RESPONSE_CACHE.clear()
+
+    def test_warm_up(self):
+        """ Test warm-up and readiness view. """
+        main.app.config.update({'JSON_RESPONSE_CACHE_SIZE': 100})
+        utils.RESPONSE_CACHE.clear()
+        temp_dir = tempfile.mkdtemp()
+        xml_path = os.path.join(temp_dir, 'users.xml')
+        try:
+            self.assertTrue(warmup.warm_up(prerender_responses=True))
+            resp = self.client.get('/api/v1/_ready')
+            self.assertEqual(resp.status_code, 200)
+            data = json.loads(resp.data)
+            self.assertEqual(data['state'], 'ready')
+            self.assertEqual(
+                [step['name'] for step in data['steps']],
+                ['presence', 'users', 'columns', 'company', 'occupancy',
+                 'responses']
+            )
+            urls = warmup.prerender_urls([10, 11])
+            self.assertEqual(len(urls), 11)
+            self.assertEqual(len(utils.RESPONSE_CACHE), len(urls))
+
+            calls = metrics.FUNCTION_SECONDS.count('get_weekday_stats')
+            self.client.get('/api/v1/mean_time_weekday/11')
+            self.assertEqual(
+                metrics.FUNCTION_SECONDS.count('get_weekday_stats'), calls
+            )
+
+            self.assertTrue(warmup.warm_up())
+            self.assertEqual(len(warmup.WARMUP_STATUS.steps), 5)
+
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV + '.missing'})
+            self.assertFalse(warmup.warm_up())
+            resp = self.client.get('/api/v1/_ready')
+            self.assertEqual(resp.status_code, 503)
+            data = json.loads(resp.data)
+            self.assertEqual(data['state'], 'failed')
+            self.assertTrue(data['error'].startswith('presence: '))
+
+            # any error marks the warm-up failed
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                    'DATA_XML': xml_path})
+            with open(xml_path, 'w') as xmlfile:
+                xmlfile.write('<intranet><users>')
+            self.assertFalse(warmup.warm_up())
+            self.assertEqual(warmup.WARMUP_STATUS.state, 'failed')
+            self.assertTrue(
+                warmup.WARMUP_STATUS.error.startswith('users: ')
+            )
+        finally:
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                    'DATA_XML': TEST_DATA_XML,
+                                    'JSON_RESPONSE_CACHE_SIZE': 0})
+            utils.RESPONSE_CACHE.clear()
+            shutil.rmtree(temp_dir)
+
+    def test_metrics(self):
+        """ Test Prometheus metrics endpoint. """
+        self.client.get('/api/v1/presence_weekday/10')
+        resp = self.client.get('/api/v1/_metrics')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain'))
+        self.assertIn('# TYPE presence_analyzer_function_seconds histogram',
+                      resp.data)
+        self.assertIn('presence_analyzer_function_seconds_count'
+                      '{function="get_weekday_stats"}', resp.data)
+        self.assertIn('presence_analyzer_response_seconds_bucket'
+                      '{endpoint="presence_weekday_view",le="+Inf"}',
+                      resp.data)
+        self.assertIn('presence_analyzer_rejected_lines 2', resp.data)
+
+        # gauges come from the backend, untracked ones are left out
+        main.app.config.update({'PRESENCE_BACKEND': 'columnar'})
+        try:
+            resp = self.client.get('/api/v1/_metrics')
+            self.assertNotIn('presence_analyzer_rejected_lines', resp.data)
+        finally:
+            main.app.config.update({'PRESENCE_BACKEND': 'memory'})
+
+    def test_request_profile(self):
+        """ Test opt-in profiling of requests. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            main.app.config.update({'PROFILE_DIR': temp_dir})
+            self.client.get('/api/v1/users', headers={'X-Profile': '1'})
+            self.assertEqual(os.listdir(temp_dir), [])
+
+            main.app.config.update({'PROFILING_ENABLED': True})
+            self.client.get('/api/v1/users')
+            self.assertEqual(os.listdir(temp_dir), [])
+            self.client.get('/api/v1/users', headers={'X-Profile': '1'})
+            self.assertEqual(len(os.listdir(temp_dir)), 1)
+            self.assertTrue(os.listdir(temp_dir)[0].startswith('api_v1_users'))
+        finally:
+            main.app.config.update({'PROFILING_ENABLED': False,
+                                    'PROFILE_DIR': None})
+            shutil.rmtree(temp_dir)
+
     def test_user_picture_view(self):
         """ Test presence of a user picture. """
         data = utils.get_users_from_xml()
@@ -140,8 +579,11 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
 
     def test_utils(self):
         """ Test pure utils functions. """
-        self.assertGreater(utils.get_absolute_seconds(datetime.datetime.now()),
-                           0)
+        self.assertEqual(
+            utils.seconds_since_midnight(datetime.time(9, 39, 5)), 34745
+        )
+        self.assertEqual(utils.seconds_to_time(34745), datetime.time(9, 39, 5))
+        self.assertEqual(utils.mean([]), 0)
 
     def test_get_data(self):
         """ Test parsing of CSV file. """
@@ -157,6 +599,677 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
             datetime.time(9, 39, 5)
         )
 
+    def test_presence_store(self):
+        """ Test refreshing of presence store after CSV file changes. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(temp_dir, 'data.csv')
+            shutil.copy(TEST_DATA_CSV, csv_path)
+            main.app.config.update({'DATA_CSV': csv_path})
+
+            data = utils.get_data()
+            self.assertIs(data, utils.get_data())
+            self.assertItemsEqual(data.keys(), [10, 11])
+            generation = utils.PRESENCE_STORE.generation
+
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('12,2013-09-16,08:00:00,16:00:')
+            appended = utils.get_data()
+            self.assertIsNot(data, appended)
+            self.assertItemsEqual(data.keys(), [10, 11])
+            self.assertEqual(appended[10], data[10])
+            self.assertNotIn(12, appended)
+
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('30\n')
+            appended = utils.get_data()
+            self.assertEqual(
+                appended[12][datetime.date(2013, 9, 16)]['end'],
+                datetime.time(16, 0, 30)
+            )
+            self.assertEqual(utils.PRESENCE_STORE.generation, generation + 2)
+            self.assertEqual(
+                backends.get_weekday_stats(12)[0],
+                utils.WeekdayStats(1, 8 * 3600 + 30, 8 * 3600, 16 * 3600 + 30)
+            )
+
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('12,2013-09-16,09:00:00,16:00:00\n')
+            self.assertEqual(
+                backends.get_weekday_stats(12)[0],
+                utils.WeekdayStats(1, 7 * 3600, 9 * 3600, 16 * 3600)
+            )
+
+            with open(csv_path, 'w') as csvfile:
+                csvfile.write('13,2013-09-16,08:00:00,16:00:00\n')
+            self.assertItemsEqual(utils.get_data().keys(), [13])
+
+            # half-written row is neither stored nor rejected
+            main.app.config.update({'DATA_DUPLICATES': 'first'})
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('13,2013-09-17,08:00:00,17:00:0')
+            self.assertNotIn(datetime.date(2013, 9, 17), utils.get_data()[13])
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('5\n13,2013-09-18,08:00:00,17:0')
+            self.assertEqual(
+                utils.get_data()[13][datetime.date(2013, 9, 17)]['end'],
+                datetime.time(17, 0, 5)
+            )
+            self.assertEqual(utils.PRESENCE_STORE.duplicates, 0)
+            self.assertEqual(utils.PRESENCE_STORE.rejected, 0)
+        finally:
+            main.app.config.update({'DATA_DUPLICATES': 'last'})
+            shutil.rmtree(temp_dir)
+
+    def test_refresh_publishing(self):
+        """ Test data is published before file state is marked loaded. """
+        published = []
+        for structure, attribute in ((utils.PresenceStore(), 'data'),
+                                     (utils.PresenceIndex(), 'ranges')):
+            def mark_loaded(path, stat, offset, structure=structure,
+                            attribute=attribute,
+                            original=structure.mark_loaded):
+                """ Records data found by unlocked readers. """
+                published.append(sorted(getattr(structure, attribute)))
+                original(path, stat, offset)
+            structure.mark_loaded = mark_loaded
+            structure.load(TEST_DATA_CSV)
+        self.assertEqual(published, [[10, 11], [10, 11]])
+
+    def test_get_weekday_stats(self):
+        """ Test weekday stats against grouping of raw presence data. """
+        data = utils.get_data()
+        self.assertIsNone(backends.get_weekday_stats(min(data) - 1))
+        for user_id, items in data.items():
+            stats = backends.get_weekday_stats(user_id)
+            weekdays = utils.group_by_weekday(items)
+            self.assertEqual([item.count for item in stats],
+                             [len(intervals) for intervals in weekdays])
+            self.assertEqual([item.interval for item in stats],
+                             [sum(intervals) for intervals in weekdays])
+            self.assertEqual(utils.weekday_mean_intervals(stats),
+                             [utils.mean(intervals) for intervals in weekdays])
+            self.assertEqual(
+                utils.weekday_start_end_means(stats),
+                utils.group_by_start_end_means(items)
+            )
+
+    def test_presence_columns(self):
+        """ Test columnar presence data against presence store. """
+        data = utils.get_data()
+        columns = utils.get_columns()
+        self.assertIs(columns, utils.get_columns())
+        self.assertEqual(len(columns),
+                         sum(len(item) for item in data.values()))
+        self.assertEqual(list(columns.users()), sorted(data))
+        self.assertIsNone(columns.weekday_stats(min(data) - 1))
+        for user_id in data:
+            self.assertEqual(columns.to_dict(user_id), data[user_id])
+            self.assertEqual(columns.weekday_stats(user_id),
+                             backends.get_weekday_stats(user_id))
+
+        main.app.config.update({'PRESENCE_BACKEND': 'columnar'})
+        try:
+            self.assertEqual(backends.get_weekday_stats(10),
+                             columns.weekday_stats(10))
+        finally:
+            main.app.config.update({'PRESENCE_BACKEND': 'memory'})
+
+    def test_company_stats(self):
+        """ Test company-wide aggregates against per-user stats. """
+        data = utils.get_data()
+        stats = backends.get_company_stats()
+        self.assertIs(stats, backends.get_company_stats())
+        user_stats = [backends.get_weekday_stats(user_id) for user_id in data]
+        self.assertEqual(stats.weekday_stats, [
+            utils.WeekdayStats(*[sum(column) for column in zip(*items)])
+            for items in zip(*user_stats)
+        ])
+        self.assertEqual(stats.start_histogram.sum(), 9)
+        self.assertEqual(stats.start_histogram[9 * 4], 2)
+        self.assertEqual(stats.end_histogram[15 * 4 + 3], 2)
+        self.assertEqual(list(stats.headcounts), [1, 1, 2, 2, 2, 1])
+
+        columns = backends.get_all_columns()
+        self.assertIs(columns, backends.get_all_columns())
+        limited = backends.get_company_stats(
+            date_from=datetime.date(2013, 9, 12)
+        )
+        self.assertEqual(list(limited.headcounts), [2, 1])
+        self.assertIs(backends.get_all_columns(), columns)
+        self.assertEqual(limited.weekday_stats[4].count, 1)
+        self.assertEqual(limited.weekday_stats[1].count, 0)
+
+        main.app.config.update({'PRESENCE_BACKEND': 'columnar'})
+        try:
+            columnar = backends.get_company_stats()
+            self.assertEqual(columnar.weekday_stats, stats.weekday_stats)
+            self.assertEqual(columnar.histogram_result(),
+                             stats.histogram_result())
+            self.assertEqual(columnar.headcount_result(),
+                             stats.headcount_result())
+        finally:
+            main.app.config.update({'PRESENCE_BACKEND': 'memory'})
+
+    def test_occupancy_index(self):
+        """ Test occupancy index against presence entries. """
+        data = utils.get_data()
+        index = backends.get_occupancy_index()
+        self.assertIs(index, backends.get_occupancy_index())
+        for row, day in enumerate(index.dates):
+            date = datetime.date.fromordinal(day)
+            for slot in range(0, 24 * 4):
+                start = slot * utils.HISTOGRAM_BIN_SIZE
+                end = start + utils.HISTOGRAM_BIN_SIZE
+                present = [
+                    user_id for user_id, items in data.items()
+                    if date in items and
+                    utils.seconds_since_midnight(items[date]['start']) < end
+                    and utils.seconds_since_midnight(items[date]['end']) >
+                    start
+                ]
+                self.assertEqual(index.occupancy[row, slot], len(present))
+
+        self.assertEqual(index.date_range(datetime.date(2013, 9, 11)),
+                         (3, 6))
+        self.assertEqual(index.date_range(datetime.date(2014, 1, 1),
+                                          datetime.date(2013, 1, 1)),
+                         (6, 6))
+
+    def test_parse_presence_rows(self):
+        """ Test fast and strict parsing of presence CSV lines. """
+        expected = (10, datetime.date(2013, 9, 10),
+                    datetime.time(9, 39, 5), datetime.time(17, 59, 52))
+        counters = {}
+        self.assertEqual(
+            list(utils.parse_presence_rows([
+                'user_id,date,start\n',
+                '10,2013-09-10,09:39:05,17:59:52\r\n',
+                '10,2013-02-30,09:39:05,17:59:52\n',
+                '10,2013-09-10,9:39:05,"17:59:52"\n',
+                '10,ccc,09:39:05,17:59:52\n',
+                '\n',
+            ], counters)),
+            [expected, expected]
+        )
+        self.assertEqual(counters, {'rejected': 3})
+
+        counters = {}
+        rows = list(utils.parse_presence_rows(open(TEST_DATA_CSV), counters))
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(counters, {'rejected': 2})
+
+        utils.get_data()
+        self.assertEqual(utils.PRESENCE_STORE.rejected, 2)
+
+    def test_snapshot(self):
+        """ Test writing and memory-mapped reading of presence snapshot. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            snapshot_path = os.path.join(temp_dir, 'data.snapshot')
+            self.assertEqual(
+                snapshot.write_snapshot(TEST_DATA_CSV, snapshot_path), (2, 9)
+            )
+            main.app.config.update({'DATA_SNAPSHOT': snapshot_path,
+                                    'PRESENCE_BACKEND': 'snapshot'})
+            presence_snapshot = snapshot.get_snapshot()
+            self.assertIs(presence_snapshot, snapshot.get_snapshot())
+            self.assertFalse(presence_snapshot.is_stale(TEST_DATA_CSV))
+            self.assertEqual(len(presence_snapshot), 9)
+            self.assertEqual(list(presence_snapshot.user_ids()), [10, 11])
+            self.assertIsNone(presence_snapshot.user_records(12))
+            self.assertIsNone(backends.get_weekday_stats(9))
+
+            data = utils.get_data()
+            columns = utils.get_columns()
+            for user_id in data:
+                self.assertEqual(presence_snapshot.to_dict(user_id),
+                                 data[user_id])
+                self.assertEqual(backends.get_weekday_stats(user_id),
+                                 columns.weekday_stats(user_id))
+            snapshot_columns = presence_snapshot.columns()
+            for name in ('user_ids', 'days', 'starts', 'ends'):
+                self.assertEqual(list(getattr(snapshot_columns, name)),
+                                 list(getattr(columns, name)))
+
+            # changed CSV file is read by memory backend
+            csv_path = os.path.join(temp_dir, 'data.csv')
+            shutil.copy(TEST_DATA_CSV, csv_path)
+            snapshot.write_snapshot(csv_path, snapshot_path)
+            main.app.config.update({'DATA_CSV': csv_path})
+            self.assertEqual(backends.get_backend(), 'snapshot')
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('12,2013-09-16,08:00:00,16:00:00\n')
+            self.assertTrue(snapshot.is_snapshot_stale())
+            self.assertEqual(backends.get_backend(), 'memory')
+            self.assertEqual(backends.get_weekday_stats(12)[0].count, 1)
+            snapshot.write_snapshot(csv_path, snapshot_path)
+            self.assertEqual(backends.get_backend(), 'snapshot')
+            self.assertEqual(backends.get_weekday_stats(12)[0].count, 1)
+
+            with open(snapshot_path, 'wb') as snapshot_file:
+                snapshot_file.write('user_id,date,start,end\n')
+            self.assertRaises(ValueError, snapshot.get_snapshot)
+        finally:
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                    'PRESENCE_BACKEND': 'memory'})
+            shutil.rmtree(temp_dir)
+
+    def test_presence_index(self):
+        """ Test per-user byte ranges index of CSV file. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(temp_dir, 'data.csv')
+            shutil.copy(TEST_DATA_CSV, csv_path)
+            main.app.config.update({'DATA_CSV': csv_path,
+                                    'PRESENCE_BACKEND': 'indexed'})
+
+            ranges = utils.PRESENCE_INDEX.load(csv_path)
+            self.assertItemsEqual(ranges.keys(), [10, 11])
+            self.assertEqual(len(ranges[10]), 1)
+            self.assertEqual(ranges[10][0][0], 0)
+            self.assertIsNone(backends.get_user_data(12))
+            self.assertIsNone(backends.get_weekday_stats(12))
+
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('10,2013-09-16,08:00:00,16:00:00\n12,2013-09')
+            ranges = utils.PRESENCE_INDEX.load(csv_path)
+            self.assertEqual(len(ranges[10]), 2)
+            self.assertNotIn(12, ranges)
+            self.assertEqual(
+                backends.get_weekday_stats(10)[0],
+                utils.WeekdayStats(1, 8 * 3600, 8 * 3600, 16 * 3600)
+            )
+
+            data = utils.get_data()
+            for user_id in data:
+                self.assertEqual(backends.get_user_data(user_id),
+                                 data[user_id])
+
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('-16,08:00:00,16:00:00\n')
+            self.assertEqual(backends.get_user_data(12).keys(),
+                             [datetime.date(2013, 9, 16)])
+        finally:
+            main.app.config.update({'PRESENCE_BACKEND': 'memory'})
+            shutil.rmtree(temp_dir)
+
+    def test_stream_weekday_stats(self):
+        """ Test streaming aggregation of presence data. """
+        counters = {}
+        aggregates = utils.stream_weekday_stats(TEST_DATA_CSV,
+                                                counters=counters)
+        self.assertEqual(counters, {'rejected': 2})
+        self.assertItemsEqual(aggregates.keys(), [10, 11])
+        for user_id, stats in aggregates.items():
+            self.assertEqual(stats, backends.get_weekday_stats(user_id))
+
+        rows = [
+            (10, datetime.date(2013, 9, 16),
+             datetime.time(9, 0, 0), datetime.time(17, 0, 0)),
+            (10, datetime.date(2013, 9, 16),
+             datetime.time(8, 0, 0), datetime.time(17, 0, 0)),
+        ]
+        self.assertEqual(
+            utils.aggregate_presence_rows(rows)[10][0],
+            utils.WeekdayStats(1, 9 * 3600, 8 * 3600, 17 * 3600)
+        )
+        self.assertEqual(
+            utils.aggregate_presence_rows(rows, False)[10][0],
+            utils.WeekdayStats(2, 17 * 3600, 17 * 3600, 34 * 3600)
+        )
+
+        # duplicate in a later group of the user's rows replaces the entry
+        rows[1:1] = [(11, datetime.date(2013, 9, 16),
+                      datetime.time(9, 0, 0), datetime.time(10, 0, 0))]
+        interleaved = utils.aggregate_presence_rows(rows)
+        self.assertEqual(interleaved[10][0],
+                         utils.WeekdayStats(1, 9 * 3600, 8 * 3600, 17 * 3600))
+        self.assertEqual(interleaved[11][0],
+                         utils.WeekdayStats(1, 3600, 9 * 3600, 10 * 3600))
+
+        main.app.config.update({'PRESENCE_BACKEND': 'streaming'})
+        try:
+            self.assertEqual(backends.get_weekday_stats(11), aggregates[11])
+            self.assertIsNone(backends.get_weekday_stats(12))
+        finally:
+            main.app.config.update({'PRESENCE_BACKEND': 'memory'})
+
+    def test_load_presence_chunks(self):
+        """ Test parallel load of presence data. """
+        size = os.path.getsize(TEST_DATA_CSV)
+        chunks = utils.split_into_chunks(TEST_DATA_CSV, size, 3)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], size)
+        self.assertEqual(
+            utils.load_presence_chunks(TEST_DATA_CSV, size, 1, 10)[2], 0
+        )
+
+        counters = {}
+        data, aggregates, offset = utils.load_presence_chunks(
+            TEST_DATA_CSV, size, 3, 10, counters=counters
+        )
+        self.assertEqual(offset, size)
+        self.assertEqual(counters, {'rejected': 2, 'duplicates': 0})
+        self.assertEqual(data, utils.get_data())
+        self.assertEqual(aggregates, utils.PRESENCE_STORE.aggregates)
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(temp_dir, 'data.csv')
+            with open(TEST_DATA_CSV) as csvfile:
+                lines = csvfile.readlines()
+            with open(csv_path, 'w') as csvfile:
+                csvfile.writelines(lines + lines[:2] + ['10,2013-09-1'])
+            main.app.config.update({'DATA_CSV': csv_path,
+                                    'DATA_LOAD_WORKERS': 4,
+                                    'DATA_LOAD_CHUNK_SIZE': 10})
+            self.assertEqual(utils.get_data(), data)
+            self.assertEqual(utils.PRESENCE_STORE.aggregates, aggregates)
+            self.assertEqual(utils.PRESENCE_STORE.offset,
+                             os.path.getsize(csv_path) - 12)
+
+            # no line ends in the last 64 KB, the file is parsed serially
+            csv_path = os.path.join(temp_dir, 'long_line.csv')
+            with open(csv_path, 'w') as csvfile:
+                csvfile.writelines(lines + ['10,' + 'x' * 70 * 1024])
+            main.app.config.update({'DATA_CSV': csv_path})
+            self.assertEqual(
+                utils.load_presence_chunks(csv_path,
+                                           os.path.getsize(csv_path), 4, 10),
+                ({}, {}, 0)
+            )
+            self.assertEqual(utils.get_data(), data)
+        finally:
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                    'DATA_LOAD_WORKERS': 1,
+                                    'DATA_LOAD_CHUNK_SIZE': utils.CHUNK_SIZE})
+            shutil.rmtree(temp_dir)
+
+    def test_sqlite_backend(self):
+        """ Test SQLite storage backend against memory one. """
+        data = utils.get_data()
+        stats = dict((user_id, backends.get_weekday_stats(user_id))
+                     for user_id in data)
+        dates = (datetime.date(2013, 9, 10), datetime.date(2013, 9, 11))
+        range_stats = backends.get_weekday_stats(11, *dates)
+        columns = backends.get_all_columns()
+        company = utils.CompanyStats.from_columns(columns)
+        occupancy = utils.OccupancyIndex.from_columns(columns)
+        temp_dir = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(temp_dir, 'data.csv')
+            sqlite_path = os.path.join(temp_dir, 'data.sqlite')
+            shutil.copy(TEST_DATA_CSV, csv_path)
+            self.assertEqual(
+                backends.import_presence_sqlite(csv_path, sqlite_path,
+                                                batch_size=2),
+                (9, 2, 0)
+            )
+            os.remove(sqlite_path)
+
+            main.app.config.update({'DATA_CSV': csv_path,
+                                    'DATA_SQLITE': sqlite_path,
+                                    'PRESENCE_BACKEND': 'sqlite'})
+            self.assertIsInstance(backends.get_storage(),
+                                  backends.SQLiteBackend)
+            for user_id in data:
+                self.assertEqual(backends.get_user_data(user_id),
+                                 data[user_id])
+                self.assertEqual(backends.get_weekday_stats(user_id),
+                                 stats[user_id])
+            self.assertIsNone(backends.get_user_data(12))
+            self.assertIsNone(backends.get_weekday_stats(12))
+            self.assertIsNone(backends.get_weekday_stats(12, *dates))
+            self.assertEqual(backends.get_weekday_stats(11, *dates),
+                             range_stats)
+            self.assertEqual(
+                backends.get_weekday_stats(11, datetime.date(2014, 1, 1)),
+                [utils.EMPTY_WEEKDAY_STATS] * 7
+            )
+            # company aggregates are computed by the database
+            backends.load_all_columns.cache_clear()
+            self.assertTrue(warmup.warm_up(prerender_responses=False))
+            self.assertEqual(backends.load_all_columns.cache_info()['size'], 0)
+            self.assertEqual(backends.get_storage().users(), sorted(data))
+            sqlite_company = backends.get_company_stats()
+            self.assertEqual(sqlite_company.weekday_stats,
+                             company.weekday_stats)
+            self.assertEqual(sqlite_company.histogram_result(),
+                             company.histogram_result())
+            self.assertEqual(sqlite_company.headcount_result(),
+                             company.headcount_result())
+            self.assertEqual(
+                backends.get_company_stats(*dates).headcount_result(),
+                utils.CompanyStats.from_columns(
+                    backends.get_all_columns(), *dates
+                ).headcount_result()
+            )
+            self.assertEqual(backends.get_occupancy_index().dates_result(),
+                             occupancy.dates_result())
+
+            # appended lines are imported into the same database
+            inode = os.stat(sqlite_path).st_ino
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('10,2013-09-10,08:00:00,12:00:00\n'
+                              '12,2013-09-16,08:00:00,16:00:00\n'
+                              '12,2013-09-17,08:00:00,16:')
+            self.assertEqual(backends.get_weekday_stats(12)[0].count, 1)
+            self.assertEqual(
+                backends.get_user_data(10)[datetime.date(2013, 9, 10)],
+                {'start': datetime.time(8, 0, 0),
+                 'end': datetime.time(12, 0, 0)}
+            )
+            self.assertEqual(os.stat(sqlite_path).st_ino, inode)
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('00:00\n')
+            self.assertEqual(backends.get_weekday_stats(12)[1].count, 1)
+            source = backends.read_sqlite_source(sqlite_path)
+            self.assertEqual(
+                (source['rows'], source['rejected'], source['duplicates']),
+                (11, 2, 1)
+            )
+            self.assertEqual(source['offset'], os.path.getsize(csv_path))
+            counters = backends.get_storage().counters()
+            self.assertEqual((counters['rejected'], counters['duplicates']),
+                             (2, 1))
+            self.assertEqual(os.stat(sqlite_path).st_ino, inode)
+
+            # other process finds the database up to date
+            backends.BACKENDS['sqlite'].imported = None
+            backends.get_weekday_stats(12)
+            self.assertEqual(os.stat(sqlite_path).st_ino, inode)
+
+            main.app.config.update({'DATA_DUPLICATES': 'first'})
+            self.assertEqual(backends.get_user_data(10), data[10])
+            self.assertEqual(backends.get_weekday_stats(10), stats[10])
+            self.assertNotEqual(os.stat(sqlite_path).st_ino, inode)
+        finally:
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                    'DATA_DUPLICATES': 'last',
+                                    'PRESENCE_BACKEND': 'memory'})
+            shutil.rmtree(temp_dir)
+
+    def test_resolve_duplicate(self):
+        """ Test duplicates policies. """
+        previous = {'start': datetime.time(9, 0, 0),
+                    'end': datetime.time(17, 0, 0)}
+        entry = {'start': datetime.time(8, 0, 0),
+                 'end': datetime.time(12, 0, 0)}
+        self.assertIs(utils.resolve_duplicate(previous, entry), entry)
+        self.assertIs(utils.resolve_duplicate(previous, entry, 'first'),
+                      previous)
+        self.assertIs(utils.resolve_duplicate(previous, entry, 'longest'),
+                      previous)
+        self.assertEqual(utils.resolve_duplicate(previous, entry, 'span'),
+                         {'start': datetime.time(8, 0, 0),
+                          'end': datetime.time(17, 0, 0)})
+        self.assertRaises(ValueError, utils.resolve_duplicate, previous,
+                          entry, 'any')
+
+        data = {}
+        aggregates = {}
+        counters = {}
+        rows = [(10, datetime.date(2013, 9, 16), item['start'], item['end'])
+                for item in (previous, entry)]
+        utils.add_presence_rows(rows, data, aggregates, 'first', counters)
+        self.assertEqual(data[10].values(), [previous])
+        self.assertEqual(aggregates[10][0],
+                         utils.WeekdayStats(1, 8 * 3600, 9 * 3600, 17 * 3600))
+        self.assertEqual(counters, {'duplicates': 1})
+
+    def test_duplicates_policy(self):
+        """ Test duplicates policy is honoured by every backend. """
+        temp_dir = tempfile.mkdtemp()
+        csv_path = os.path.join(temp_dir, 'presence.csv')
+        with open(csv_path, 'w') as csvfile:
+            csvfile.write('10,2013-09-16,09:00:00,17:00:00\n'
+                          '10,2013-09-16,08:00:00,12:00:00\n')
+        first = {datetime.date(2013, 9, 16): {
+            'start': datetime.time(9, 0, 0),
+            'end': datetime.time(17, 0, 0),
+        }}
+        main.app.config.update({'DATA_CSV': csv_path})
+        try:
+            version = utils.data_version()
+            self.assertEqual(
+                utils.get_data()[10][datetime.date(2013, 9, 16)]['start'],
+                datetime.time(8, 0, 0)
+            )
+
+            main.app.config.update({'DATA_DUPLICATES': 'first'})
+            self.assertNotEqual(utils.data_version(), version)
+            self.assertEqual(utils.get_data()[10], first)
+            self.assertEqual(utils.PRESENCE_STORE.duplicates, 1)
+            for backend in ('columnar', 'snapshot', 'indexed', 'streaming'):
+                main.app.config.update({'PRESENCE_BACKEND': backend})
+                self.assertEqual(backends.get_backend(), 'memory')
+                self.assertEqual(backends.get_user_data(10), first)
+                self.assertEqual(backends.get_weekday_stats(10)[0].interval,
+                                 8 * 3600)
+        finally:
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                    'DATA_DUPLICATES': 'last',
+                                    'PRESENCE_BACKEND': 'memory'})
+            shutil.rmtree(temp_dir)
+
+    def test_presence_sources(self):
+        """ Test merging presence data of many files. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            with open(TEST_DATA_CSV) as csvfile:
+                lines = csvfile.readlines()
+            with open(os.path.join(temp_dir, '2013-09.csv'), 'w') as csvfile:
+                csvfile.writelines(lines)
+            gzip_path = os.path.join(temp_dir, '2013-10.csv.gz')
+            with gzip.open(gzip_path, 'wb') as csvfile:
+                csvfile.write('10,2013-09-10,08:00:00,12:00:00\n'
+                              '10,2013-10-01,08:00:00,16:00:00\n')
+            with open(os.path.join(temp_dir, 'notes.txt'), 'w') as notes:
+                notes.write('not a presence file\n')
+
+            expected = utils.get_data()
+            main.app.config.update({'DATA_CSV': temp_dir})
+            data = utils.get_data()
+            store = utils.get_store()
+            self.assertIs(store, utils.PRESENCE_SOURCES)
+            self.assertEqual(store.rejected, 2)
+            self.assertEqual(store.duplicates, 1)
+            self.assertEqual(data[11], expected[11])
+            self.assertEqual(len(data[10]), len(expected[10]) + 1)
+            self.assertEqual(data[10][datetime.date(2013, 9, 10)],
+                             {'start': datetime.time(8, 0, 0),
+                              'end': datetime.time(12, 0, 0)})
+            for user_id, items in data.items():
+                self.assertEqual(
+                    [item.interval for item in backends.get_weekday_stats(
+                        user_id
+                    )],
+                    [sum(intervals)
+                     for intervals in utils.group_by_weekday(items)]
+                )
+
+            main.app.config.update({'DATA_DUPLICATES': 'longest'})
+            self.assertEqual(utils.get_data()[10][datetime.date(2013, 9, 10)],
+                             expected[10][datetime.date(2013, 9, 10)])
+            self.assertEqual(backends.get_weekday_stats(10)[1].interval,
+                             sum(utils.group_by_weekday(expected[10])[1]) +
+                             8 * 3600)
+
+            # unchanged files are not parsed again
+            parsed = dict(store.files)
+            generation = store.generation
+            version = utils.data_version()
+            with open(os.path.join(temp_dir, '2013-11.csv'), 'w') as csvfile:
+                csvfile.write('12,2013-11-04,09:00:00,17:00:00\n')
+            self.assertNotEqual(utils.data_version(), version)
+            main.app.config.update({'DATA_LOAD_WORKERS': 2})
+            self.assertEqual(sorted(utils.get_data()), [10, 11, 12])
+            self.assertEqual(store.generation, generation + 1)
+            for path, result in parsed.items():
+                self.assertIs(store.files[path], result)
+            self.assertIs(utils.get_data(), store.data)
+            self.assertEqual(store.generation, generation + 1)
+
+            main.app.config.update({'PRESENCE_BACKEND': 'columnar'})
+            self.assertEqual(backends.get_weekday_stats(12)[0].count, 1)
+
+            main.app.config.update({
+                'DATA_CSV': os.path.join(temp_dir, '2013-1*'),
+            })
+            self.assertEqual(sorted(utils.get_data()), [10, 12])
+        finally:
+            main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                    'DATA_DUPLICATES': 'last',
+                                    'DATA_LOAD_WORKERS': 1,
+                                    'PRESENCE_BACKEND': 'memory'})
+            shutil.rmtree(temp_dir)
+
+    def test_user_range_index(self):
+        """ Test weekday stats of date ranges. """
+        data = utils.get_data()
+        dates = sorted(data[11])
+        index = utils.UserRangeIndex(data[11])
+        self.assertEqual(index.weekday_stats(), backends.get_weekday_stats(11))
+        for date_from in dates:
+            for date_to in dates:
+                items = dict((date, item) for date, item in data[11].items()
+                             if date_from <= date <= date_to)
+                stats = [utils.EMPTY_WEEKDAY_STATS] * 7
+                for date, item in items.items():
+                    utils.update_weekday_stats(stats, date, item['start'],
+                                               item['end'])
+                self.assertEqual(index.weekday_stats(date_from, date_to),
+                                 stats)
+                self.assertEqual(
+                    backends.get_weekday_stats(11, date_from, date_to), stats
+                )
+        self.assertIsNone(backends.get_weekday_stats(12, dates[0]))
+
+    def test_histogram(self):
+        """ Test timing histogram. """
+        histogram = metrics.Histogram('test_seconds', 'Test.', ('name',),
+                                      buckets=(0.1, 1))
+        histogram.observe(0.05, 'a')
+        histogram.observe(0.5, 'a')
+        self.assertEqual(histogram.count('a'), 2)
+        self.assertEqual(histogram.count('b'), 0)
+        self.assertEqual(histogram.render().split('\n'), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{name="a",le="0.1"} 1',
+            'test_seconds_bucket{name="a",le="1"} 2',
+            'test_seconds_bucket{name="a",le="+Inf"} 2',
+            'test_seconds_sum{name="a"} 0.55',
+            'test_seconds_count{name="a"} 2',
+        ])
+
+        count = metrics.FUNCTION_SECONDS.count('get_data')
+        utils.get_data()
+        self.assertEqual(metrics.FUNCTION_SECONDS.count('get_data'),
+                         count + 1)
+
     def test_get_time_from_seconds(self):
         """ Test for conversion from seconds to hours, minutes, seconds. """
         self.assertEqual(utils.get_time_from_seconds(0), [0, 0, 0])
@@ -171,26 +1284,97 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
         self.assertGreater(len(data), 0)
         self.assertIsInstance(data[10], dict)
 
+    def test_user_directory(self):
+        """ Test index of users XML file. """
+        directory = utils.get_user_directory()
+        self.assertIs(directory, utils.get_user_directory())
+        self.assertEqual(len(directory), 3)
+        self.assertIn(13, directory)
+        self.assertNotIn(12, directory)
+        self.assertEqual(directory.name(10), 'User 10')
+        self.assertIsNone(directory.name(12))
+        self.assertEqual(directory.url(11),
+                         'https://intranet.stxnext.pl:443/api/images/users/11')
+        self.assertIsNone(directory.url(13))
+        self.assertEqual(directory.listing(),
+                         [(10, 'User 10'), (11, 'User 11'), (13, 'User 13')])
+        self.assertEqual(utils.get_users_from_xml()[11],
+                         {u'name': 'User 11', u'url': directory.url(11)})
+
+        previous = locale.setlocale(locale.LC_COLLATE)
+        main.app.config.update({'USERS_LOCALE': 'C'})
+        try:
+            utils.set_users_locale()
+            self.assertEqual(locale.setlocale(locale.LC_COLLATE), 'C')
+        finally:
+            main.app.config.update({'USERS_LOCALE': None})
+            locale.setlocale(locale.LC_COLLATE, previous)
+
     def test_cache(self):
         """ Test cache functionality. """
-        self.assertEqual(id(self.get_asserted_dummy_cache_data(100)),
-                         id(self.get_asserted_dummy_cache_data(100)))
+        cached = utils.cache(100)(get_dummy_data)
+        self.assertEqual(id(self.get_asserted_dummy_cache_data(cached)),
+                         id(self.get_asserted_dummy_cache_data(cached)))
 
-        cache_data = self.get_asserted_dummy_cache_data(1)
+        cached = utils.cache(1)(get_dummy_data)
+        cache_data = self.get_asserted_dummy_cache_data(cached)
         time.sleep(2)
-        cache_data_2 = self.get_asserted_dummy_cache_data(1)
+        cache_data_2 = self.get_asserted_dummy_cache_data(cached)
         self.assertNotEqual(id(cache_data), id(cache_data_2))
 
-    def get_asserted_dummy_cache_data(self, seconds):
+    def get_asserted_dummy_cache_data(self, cached):
         """ Helper method to get decorated cache data. """
-        cache_data = utils.cache(seconds)(get_dummy_data)()
+        cache_data = cached()
         self.assertIsInstance(cache_data, dict)
         self.assertGreater(len(cache_data), 0)
         self.assertIsInstance(cache_data[10], dict)
         return cache_data
 
+    def test_cache_keys(self):
+        """ Test caching of results by arguments and LRU eviction. """
+        calls = []
+
+        @utils.cache(100, max_entries=2)
+        def power(base, exponent=2):
+            """ Dummy function for cache. """
+            calls.append((base, exponent))
+            return base ** exponent
+
+        @utils.cache(100)
+        def other(base, exponent=2):
+            """ Dummy function for cache. """
+            return -base
+
+        self.assertEqual(power(2), 4)
+        self.assertEqual(power(2, exponent=3), 8)
+        self.assertEqual(other(2), -2)
+        self.assertEqual(power(2), 4)
+        self.assertEqual(power(3), 9)
+        self.assertEqual(power(2), 4)
+        self.assertEqual(power(2, exponent=3), 8)
+        self.assertEqual(calls, [(2, 2), (2, 3), (3, 2), (2, 3)])
+        self.assertEqual(power.cache_info(),
+                         {'hits': 2, 'misses': 4, 'evictions': 2, 'size': 2})
+
+        power.cache_clear()
+        self.assertEqual(power(2), 4)
+        self.assertEqual(len(calls), 5)
+
+        # keyword arguments never match a positional tuple
+        self.assertEqual(other(-1, ('exponent', 2)), 1)
+        self.assertEqual(other(-1, exponent=2), 1)
+        self.assertEqual(other.cache_info()['misses'], 3)
+
     def test_save_threading_cache(self):
         """ Test save threading of cache. """
+        calls = []
+
+        @utils.cache(600)
+        def slow_dummy_data():
+            """ Dummy function for cache. """
+            calls.append(None)
+            time.sleep(0.1)
+            return get_dummy_data()
 
         class CacheThread(threading.Thread):
             """ Cache thread. """
@@ -201,7 +1385,7 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
 
             def run(self):
                 """ Thread activity. """
-                self._id = id(utils.cache(600)(get_dummy_data)())
+                self._id = id(slow_dummy_data())
 
             def cache_id(self):
                 """ Cache id. """
@@ -218,6 +1402,31 @@ class PresenceAnalyzerUtilsTestCase(unittest.TestCase):
 
         unique_ids = set([thread.cache_id() for thread in cache_threads])
         self.assertEqual(len(unique_ids), 1)
+        self.assertEqual(len(calls), 1)
+
+
+class UsersXMLHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Local stand-in of the users XML server. """
+
+    body = ''
+    requests = []
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """ Serves body with ETag, honours If-None-Match. """
+        self.requests.append(self.headers.get('If-None-Match'))
+        etag = '"%s"' % hash(self.body)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """ Keeps test output clean. """
 
 
 class PresenceAnalyzerHelpersTestCase(unittest.TestCase):
@@ -243,6 +1452,320 @@ class PresenceAnalyzerHelpersTestCase(unittest.TestCase):
         self.assertTrue(helpers.save_users_from_www())
         self.assertFalse(helpers.save_users_from_www(TEST_INI_FILENAME))
 
+    def test_users_refresher(self):
+        """ Test conditional downloading of users XML file. """
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), UsersXMLHandler)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        temp_dir = tempfile.mkdtemp()
+        try:
+            url = 'http://127.0.0.1:%s/users.xml' % server.server_port
+            path = os.path.join(temp_dir, 'users.xml')
+            with open(TEST_DATA_XML) as xmlfile:
+                UsersXMLHandler.body = xmlfile.read()
+            refreshed = []
+            refresher = helpers.UsersRefresher(
+                url, path, 600, on_refresh=lambda: refreshed.append(True)
+            )
+
+            self.assertTrue(refresher.refresh())
+            with open(path) as xmlfile:
+                self.assertEqual(xmlfile.read(), UsersXMLHandler.body)
+            self.assertEqual(refreshed, [True])
+            self.assertFalse(refresher.refresh())
+            self.assertEqual(UsersXMLHandler.requests[-1], refresher.etag)
+            self.assertEqual(refreshed, [True])
+
+            UsersXMLHandler.body = '<intranet><server/></intranet>'
+            self.assertFalse(refresher.refresh())
+            UsersXMLHandler.body = '<intranet><users>'
+            self.assertFalse(refresher.refresh())
+            self.assertEqual(os.listdir(temp_dir), ['users.xml'])
+            self.assertTrue(helpers.is_users_xml(path))
+
+            # temporary file is removed when validation fails
+            def failing_validation(path):  # pylint: disable=unused-argument
+                """ Validation failing with an unexpected error. """
+                raise RuntimeError('validation failed')
+
+            is_users_xml = helpers.is_users_xml
+            helpers.is_users_xml = failing_validation
+            try:
+                self.assertRaises(RuntimeError, helpers.fetch_users_xml,
+                                  url, path)
+            finally:
+                helpers.is_users_xml = is_users_xml
+            self.assertEqual(os.listdir(temp_dir), ['users.xml'])
+
+            refresher.url = 'http://127.0.0.1:1/users.xml'
+            self.assertFalse(refresher.refresh())
+
+            refresher.start()
+            refresher.stop()
+            refresher.join(5)
+            self.assertFalse(refresher.is_alive())
+
+            # errors do not end the thread
+            calls = []
+
+            def failing_refresh():
+                """ Refresh failing with an unexpected error. """
+                calls.append(True)
+                raise RuntimeError('refresh failed')
+
+            refresher = helpers.UsersRefresher(url, path, 0.01)
+            refresher.refresh = failing_refresh
+            refresher.start()
+            deadline = time.time() + 5
+            while len(calls) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(refresher.is_alive())
+            self.assertGreaterEqual(len(calls), 2)
+            refresher.stop()
+            refresher.join(5)
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(temp_dir)
+
+
+class PresenceAnalyzerServerTestCase(unittest.TestCase):
+    """ Production server tests. """
+
+    def setUp(self):
+        """ Before each test, set up a environment. """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                'DATA_XML': TEST_DATA_XML})
+
+    def tearDown(self):
+        """ Get rid of unused objects after each test. """
+        main.app.config.update({'DEBUG': True})
+
+    def test_server_config(self):
+        """ Test gunicorn configuration of the server. """
+        application = server.PresenceAnalyzerServer({'workers': 2,
+                                                     'threads': 3})
+        self.assertEqual(application.cfg.workers, 2)
+        self.assertEqual(application.cfg.threads, 3)
+        self.assertEqual(application.cfg.worker_class_str, 'gthread')
+        self.assertTrue(application.cfg.preload_app)
+        self.assertEqual(application.cfg.address,
+                         [('0.0.0.0', 5000)])
+        self.assertIs(application.load(), main.app)
+        self.assertFalse(main.app.config['DEBUG'])
+
+        application = server.PresenceAnalyzerServer({'threads': 1})
+        self.assertEqual(application.cfg.worker_class_str, 'sync')
+
+    def test_data_watcher(self):
+        """ Test detecting data changes. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(temp_dir, 'data.csv')
+            shutil.copy(TEST_DATA_CSV, csv_path)
+            main.app.config.update({'DATA_CSV': csv_path})
+            results = [False, True]
+            changes = []
+
+            def on_change():
+                """ Records change and returns its result. """
+                changes.append(True)
+                return results.pop(0)
+
+            watcher = server.DataWatcher(600, on_change)
+            self.assertFalse(watcher.check())
+            with open(csv_path, 'a') as csvfile:
+                csvfile.write('12,2013-09-16,08:00:00,16:00:00\n')
+            # failed change is retried
+            self.assertTrue(watcher.check())
+            self.assertTrue(watcher.check())
+            self.assertFalse(watcher.check())
+            self.assertEqual(changes, [True, True])
+
+            # workers are replaced only after a successful warm-up
+            kills = []
+            warm_up, kill = server.warm_up, server.os.kill
+            server.os.kill = lambda pid, signum: kills.append(signum)
+            try:
+                server.warm_up = lambda: False
+                self.assertFalse(server.reload_workers())
+                self.assertEqual(kills, [])
+                server.warm_up = lambda: True
+                self.assertTrue(server.reload_workers())
+                self.assertEqual(kills, [server.signal.SIGHUP])
+            finally:
+                server.warm_up, server.os.kill = warm_up, kill
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class PresenceAnalyzerBenchmarkTestCase(unittest.TestCase):
+    """ Benchmark tests. """
+
+    def setUp(self):
+        """ Before each test, set up a environment. """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                'DATA_XML': TEST_DATA_XML})
+
+    def tearDown(self):
+        """ Get rid of unused objects after each test. """
+        pass
+
+    def test_generate_presence_csv(self):
+        """ Test generating of synthetic presence data. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(temp_dir, 'data.csv')
+            rows = benchmark.generate_presence_csv(csv_path, 2, 1)
+            with open(csv_path) as csvfile:
+                parsed = list(utils.parse_presence_rows(csvfile))
+            self.assertEqual(len(parsed), rows)
+            self.assertItemsEqual(set(row[0] for row in parsed), [10, 11])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_benchmarks(self):
+        """ Test benchmarks on tiny synthetic data. """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            report = benchmark.run_benchmarks(2, 1, 2, temp_dir)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        self.assertEqual(report['params']['users'], 2)
+        self.assertIn('get_data_cold', report['results'])
+        self.assertIn('/api/v1/presence_weekday/10', report['results'])
+        self.assertIn('/api/v1/occupancy/weekday/0', report['results'])
+        for result in report['results'].values():
+            self.assertItemsEqual(result.keys(),
+                                  ['ops_per_sec', 'p50_ms', 'p99_ms'])
+        self.assertGreater(report['peak_memory_kb'], 0)
+        json.dumps(report)
+
+        client = main.app.test_client()
+        self.assertEqual(benchmark.get_ok(client, '/api/v1/users').status_code,
+                         200)
+        with self.assertRaises(AssertionError):
+            benchmark.get_ok(client, '/api/v1/company/occupancy')
+        self.assertEqual(main.app.config['DATA_CSV'], TEST_DATA_CSV)
+
+
+class PresenceAnalyzerReportsTestCase(unittest.TestCase):
+    """ Overtime and anomalies report tests. """
+
+    def setUp(self):
+        """ Before each test, set up a environment. """
+        main.app.config.update({'DATA_CSV': TEST_DATA_CSV,
+                                'DATA_XML': TEST_DATA_XML})
+        self.client = main.app.test_client()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """ Get rid of unused objects after each test. """
+        shutil.rmtree(self.temp_dir)
+
+    def test_scan_presence_line(self):
+        """ Test scanning of presence lines with missing end. """
+        self.assertEqual(
+            reports.scan_presence_line('11,2013-09-12,10:18:36\n'),
+            (11, datetime.date(2013, 9, 12), datetime.time(10, 18, 36), None)
+        )
+        self.assertEqual(
+            reports.scan_presence_line('11,2013-09-12,10:18:36,\n')[3], None
+        )
+        self.assertIsNone(reports.scan_presence_line('user_id,date\n'))
+        self.assertRaises(ValueError, reports.scan_presence_line,
+                          '11,ccc,13:16:56,15:04:02\n')
+
+    def test_build_report(self):
+        """ Test computing of the report. """
+        csv_path = os.path.join(self.temp_dir, 'data.csv')
+        shutil.copy(TEST_DATA_CSV, csv_path)
+        with open(csv_path, 'a') as csvfile:
+            csvfile.write('10,2013-09-13,18:00:00,09:00:00\n'
+                          '10,2013-09-16,06:00:00,20:00:00\n'
+                          '10,2013-09-10,08:00:00,12:00:00\n')
+        report = reports.build_report(csv_path, 'last', 8, 12)
+        self.assertEqual(report['sources'], ['data.csv'])
+        self.assertEqual(report['summary'], {
+            'rows': 13, 'rejected': 1, 'users': 2,
+            'anomalies': {'missing_end': 1, 'end_before_start': 1,
+                          'overlong': 1, 'duplicate': 1},
+        })
+
+        data = utils.get_data()
+        user = report['users']['11']
+        self.assertEqual(user['days'], 6)
+        self.assertEqual(user['hours'], round(sum(
+            utils.interval(item['start'], item['end'])
+            for item in data[11].values()
+        ) / 3600.0, 2))
+        self.assertEqual(user['anomalies'],
+                         [['2013-09-12', 'missing_end', '10:18:36', None]])
+        self.assertEqual(user['overtime_hours'], 0)
+        self.assertEqual([week[0] for week in user['weekly_hours']],
+                         ['2013-09-02', '2013-09-09'])
+        self.assertEqual(user['max_rolling_week_hours'],
+                         user['weekly_hours'][1][1])
+
+        user = report['users']['10']
+        self.assertEqual(user['days'], 4)
+        self.assertEqual(user['overtime_hours'], 6)
+        self.assertEqual(user['weekly_hours'][-1], ['2013-09-16', 14])
+        self.assertEqual([anomaly[1] for anomaly in user['anomalies']],
+                         ['end_before_start', 'overlong', 'duplicate'])
+
+        report = reports.build_report(csv_path, 'first', 4, 24)
+        self.assertNotIn('overlong', report['summary']['anomalies'])
+        self.assertGreater(report['users']['10']['overtime_hours'], 10)
+
+    def test_report_views(self):
+        """ Test serving of saved report. """
+        report_path = os.path.join(self.temp_dir, 'report.json.gz')
+        main.app.config.update({'REPORT_FILE': report_path})
+        try:
+            resp = self.client.get('/api/v1/report')
+            self.assertEqual(resp.status_code, 404)
+
+            reports.write_report(reports.build_report(TEST_DATA_CSV),
+                                 report_path)
+            resp = self.client.get('/api/v1/report')
+            self.assertEqual(resp.status_code, 200)
+            data = json.loads(resp.data)
+            self.assertEqual(data['summary']['users'], 2)
+            self.assertEqual(data['users']['11']['anomalies'], 1)
+            self.assertNotIn('weekly_hours', data['users']['11'])
+            self.assertIn('public', resp.headers['Cache-Control'])
+            self.assertEqual(resp.last_modified,
+                             datetime.datetime.utcfromtimestamp(
+                                 int(os.stat(report_path).st_mtime)
+                             ))
+
+            main.app.config.update({'JSON_GZIP_MIN_SIZE': 10})
+            resp = self.client.get('/api/v1/report',
+                                   headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(
+                json.loads(gzip.GzipFile(fileobj=StringIO(resp.data)).read()),
+                data
+            )
+
+            resp = self.client.get('/api/v1/report/11')
+            self.assertEqual(resp.status_code, 200)
+            data = json.loads(resp.data)
+            self.assertEqual(len(data['weekly_hours']), 2)
+            resp = self.client.get('/api/v1/report/11', headers={
+                'If-None-Match': resp.get_etag()[0],
+            })
+            self.assertEqual(resp.status_code, 304)
+
+            resp = self.client.get('/api/v1/report/12')
+            self.assertEqual(resp.status_code, 404)
+        finally:
+            main.app.config.update({'JSON_GZIP_MIN_SIZE': 1024,
+                                    'REPORT_FILE': main.MAIN_REPORT_FILE})
+
 
 def suite():
     """ Default test suite. """
@@ -250,6 +1773,9 @@ def suite():
     base_suite.addTest(unittest.makeSuite(PresenceAnalyzerViewsTestCase))
     base_suite.addTest(unittest.makeSuite(PresenceAnalyzerUtilsTestCase))
     base_suite.addTest(unittest.makeSuite(PresenceAnalyzerHelpersTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerServerTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerBenchmarkTestCase))
+    base_suite.addTest(unittest.makeSuite(PresenceAnalyzerReportsTestCase))
     return base_suite
 
 
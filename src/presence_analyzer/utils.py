@@ -1,13 +1,33 @@
 # -*- coding: utf-8 -*-
 """ Helper functions used in views. """
 
+import array
+import bisect
+import calendar
 import csv
 import functools
+import glob
+import gzip
+import hashlib
+import itertools
+import locale
 import logging
+import multiprocessing
+import numpy
+import os
+import time
 
+from cStringIO import StringIO
+from collections import OrderedDict
+from collections import namedtuple
+from datetime import date as dt_date
 from datetime import datetime
+from datetime import time as dt_time
 from datetime import timedelta
 from flask import Response
+from flask import abort
+from flask import request
+from flask_mako import render_template
 from functools import wraps
 from itertools import groupby
 from json import dumps
@@ -15,57 +35,1071 @@ from lxml import etree
 from operator import itemgetter
 from threading import Lock
 
+from presence_analyzer.helpers import UsersRefresher
 from presence_analyzer.main import app
+from presence_analyzer.metrics import RESPONSE_SECONDS
+from presence_analyzer.metrics import timed
 
 
 LOG = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# separates positional and keyword arguments in cache keys
+KWARGS_MARK = object()
 
-def get_absolute_seconds(time):
-    """ Get number of seconds for a time parameter. """
-    return int(time.strftime('%s'))
 
+def cache(max_duration, max_entries=128):
+    """
+    Caches results of decorated function keyed by its arguments.
 
-def cache(max_duration):
-    """ Cache decorator to cache of users data. """
-    if not hasattr(cache, 'cache'):
-        cache.cache = {}
-    if not hasattr(cache, 'time'):
-        cache.time = None
-    if not hasattr(cache, 'lock'):
-        cache.lock = Lock()
+    Every decorated function has its own storage. Results expire after
+    max_duration seconds and the least recently used ones are evicted when
+    there are more than max_entries of them. Hits are served without
+    locking, a missing result is computed only once even if many threads
+    ask for it at the same time.
 
+    Decorated function gets cache_info() returning hit, miss and eviction
+    counters and cache_clear() dropping all stored results.
+    """
     def decorator(function):
         """ Inner function wrapper. """
+        entries = {}  # key -> [result, expiration time, last use tick]
+        key_locks = {}
+        lock = Lock()
+        ticks = itertools.count()
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        def lookup(key):
+            """ Returns valid cache entry for a key or None. """
+            entry = entries.get(key)
+            if entry is None or entry[1] < time.time():
+                return None
+            entry[2] = next(ticks)
+            stats['hits'] += 1
+            return entry
+
+        def evict():
+            """ Removes expired and least recently used entries. """
+            now = time.time()
+            for key in [key for key, entry in entries.items()
+                        if entry[1] < now]:
+                del entries[key]
+                stats['evictions'] += 1
+            while len(entries) > max_entries:
+                del entries[min(entries, key=lambda key: entries[key][2])]
+                stats['evictions'] += 1
+
         @functools.wraps(function)
-        def wrapper(*args, **kargs):
+        def wrapper(*args, **kwargs):
             """ Inner parameters wrapper. """
-            with cache.lock:
-                now = datetime.now()
-                if cache.time is None or (
-                        (get_absolute_seconds(now) -
-                         get_absolute_seconds(cache.time)) > max_duration):
-                    cache.time = now
-                    cache.cache = function(*args, **kargs)
-            return cache.cache
+            key = (args + (KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+                   if kwargs else args)
+            entry = lookup(key)
+            if entry is not None:
+                return entry[0]
+
+            with lock:
+                key_lock = key_locks.setdefault(key, Lock())
+            with key_lock:
+                entry = lookup(key)
+                if entry is not None:
+                    return entry[0]
+                try:
+                    stats['misses'] += 1
+                    result = function(*args, **kwargs)
+                    with lock:
+                        entries[key] = [result, time.time() + max_duration,
+                                        next(ticks)]
+                        evict()
+                finally:
+                    with lock:
+                        key_locks.pop(key, None)
+            return result
+
+        def cache_info():
+            """ Returns cache counters. """
+            return dict(stats, size=len(entries))
+
+        def cache_clear():
+            """ Drops all cached results. """
+            with lock:
+                entries.clear()
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
         return wrapper
     return decorator
 
 
-def jsonify(function):
+class RawJSON(str):
+    """ Already serialized JSON returned by views wrapped with jsonify. """
+
+
+def data_versions():
+    """ Returns versions of presence and users data. """
+    return [data_version(), file_version(app.config['DATA_XML'])]
+
+
+def response_validators(versions=data_versions):
+    """
+    Returns strong ETag and last modification time of current request's
+    response, derived from file versions returned by given callable
+    (presence and users data by default), endpoint and arguments. Returns
+    (None, None) if the files cannot be read.
+    """
+    try:
+        versions = versions()
+    except OSError:
+        return None, None
+
+    key = repr((versions, request.path, sorted(request.args.items(True))))
+    last_modified = max(version_mtime(version) for version in versions)
+    return (hashlib.sha1(key).hexdigest(),
+            datetime.utcfromtimestamp(int(last_modified)))
+
+
+def version_mtime(version):
+    """
+    Returns modification time of a file version token, or the latest one of
+    file versions of data_version() (0 if no file matched).
+    """
+    if isinstance(version[-1], tuple):
+        return max([item[-1] for item in version[-1]] or [0])
+    return version[-1]
+
+
+def is_not_modified(etag, last_modified):
+    """
+    Checks request's conditional headers against response validators. ETags
+    are compared weakly, as If-None-Match requires.
+    """
+    if request.if_none_match:
+        return (request.if_none_match.contains_weak(etag) or
+                request.if_none_match.contains_weak(etag + '-gzip'))
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+class ResponseCache(object):
+    """
+    Encoded JSON bodies of GET responses keyed by their ETag, so they change
+    together with data versions. The least recently used bodies are evicted
+    above given number of entries.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.bodies = OrderedDict()
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def get(self, key):
+        """ Returns stored body or None. """
+        with self.lock:
+            body = self.bodies.pop(key, None)
+            if body is not None:
+                self.bodies[key] = body
+        return body
+
+    def put(self, key, body, max_entries):
+        """ Stores a body. """
+        with self.lock:
+            self.bodies.pop(key, None)
+            self.bodies[key] = body
+            while len(self.bodies) > max_entries:
+                self.bodies.popitem(last=False)
+
+    def clear(self):
+        """ Drops all stored bodies. """
+        with self.lock:
+            self.bodies.clear()
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def cached_body(key, render):
+    """
+    Returns body stored in the response cache under given key or, if there
+    is none, the one returned by render callable. The cache is used for
+    GET requests (key is their ETag) when JSON_RESPONSE_CACHE_SIZE is set.
+    """
+    max_entries = app.config['JSON_RESPONSE_CACHE_SIZE']
+    if key is None or not max_entries:
+        return render()
+
+    body = RESPONSE_CACHE.get(key)
+    if body is None:
+        body = render()
+        RESPONSE_CACHE.put(key, body, max_entries)
+    return body
+
+
+def gzip_compress(body):
+    """ Compresses response body with gzip. """
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6) as gzfile:
+        gzfile.write(body)
+    return buf.getvalue()
+
+
+def jsonify(function, versions=data_versions):
     """
     Creates a response with the JSON representation of wrapped function result.
+
+    GET responses get ETag and Last-Modified validators derived from the data
+    versions (or file versions returned by versions callable, see
+    jsonify_with()), conditional requests are answered with 304 before the
+    wrapped function is called. Bodies of at least JSON_GZIP_MIN_SIZE bytes are
+    compressed for clients accepting gzip. Bodies of GET responses can be
+    kept in the response cache, see cached_body().
     """
     @wraps(function)
     def inner(*args, **kwargs):
         """ This docstring will be overridden by @wraps decorator. """
-        return Response(
-            dumps(function(*args, **kwargs)),
-            mimetype='application/json'
-        )
+        started = time.time()
+        try:
+            return make_json_response(function, versions, *args, **kwargs)
+        finally:
+            RESPONSE_SECONDS.observe(time.time() - started, function.__name__)
     return inner
 
 
+def jsonify_with(versions):
+    """
+    Returns jsonify decorator validating responses with file versions
+    returned by given callable instead of presence and users data versions.
+    """
+    return functools.partial(jsonify, versions=versions)
+
+
+@timed
+def encode_json(data):
+    """ Serializes data to JSON. """
+    return dumps(data)
+
+
+def make_json_response(function, versions, *args, **kwargs):
+    """ Creates JSON response for jsonify, see its description. """
+    etag = last_modified = None
+    if request.method in ('GET', 'HEAD'):
+        etag, last_modified = response_validators(versions)
+    if etag is not None and is_not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        def render():
+            """ Calls wrapped function and serializes its result. """
+            result = function(*args, **kwargs)
+            return result if isinstance(result, RawJSON) else encode_json(
+                result
+            )
+
+        body = cached_body(etag, render)
+        response = Response(body, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        if (len(body) >= app.config['JSON_GZIP_MIN_SIZE'] and
+                request.accept_encodings['gzip'] > 0):
+            response.set_data(cached_body(
+                etag and etag + '-gzip', lambda: gzip_compress(body)
+            ))
+            response.headers['Content-Encoding'] = 'gzip'
+            if etag is not None:
+                etag += '-gzip'
+
+    if etag is not None:
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['JSON_CACHE_MAX_AGE']
+    return response
+
+
+def templates_version():
+    """
+    Returns token identifying state of all page templates and static files
+    linked from them.
+    """
+    return tuple(file_version(path) for path in sorted(
+        glob.glob(os.path.join(app.root_path, app.template_folder, '*.html')) +
+        glob.glob(os.path.join(app.static_folder, '*', '*'))
+    ))
+
+
+@cache(24 * 3600, max_entries=64)
+def static_file_hash(path, version):  # pylint: disable=unused-argument
+    """
+    Returns short hash of static file content. File version is only a part
+    of cache key.
+    """
+    with open(path, 'rb') as static_file:
+        return hashlib.sha1(static_file.read()).hexdigest()[:12]
+
+
+def static_url(filename):
+    """
+    Returns URL of a static file with hash of its content in the query, so
+    browsers caching static files for SEND_FILE_MAX_AGE_DEFAULT fetch it
+    again right after it changes.
+    """
+    path = os.path.join(app.static_folder, filename)
+    return '/static/{}?v={}'.format(filename,
+                                    static_file_hash(path, file_version(path)))
+
+
+@cache(24 * 3600, max_entries=32)
+def load_page(name, version):  # pylint: disable=unused-argument
+    """
+    Renders page template into bytes and their ETag. Templates version is
+    only a part of cache key.
+    """
+    body = render_template(name, name='mako', static_url=static_url)
+    if isinstance(body, unicode):
+        body = body.encode('utf-8')
+    return body, hashlib.sha1(body).hexdigest()
+
+
+def render_page(name):
+    """
+    Returns response with page rendered from given template. Rendered pages
+    do not depend on the request, so they are kept in memory until any
+    template changes and conditional requests are answered with 304.
+    """
+    body, etag = load_page(name, templates_version())
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['PAGE_CACHE_MAX_AGE']
+    return response.make_conditional(request)
+
+
+def split_presence_line(line):
+    """
+    Splits presence CSV line into fields. Returns None for lines with
+    a wrong number of fields (header, footer).
+    """
+    fields = line.rstrip('\r\n').split(',')
+    if len(fields) != 4 or '"' in line:
+        fields = next(csv.reader([line], delimiter=','), [])
+    return fields if len(fields) == 4 else None
+
+
+def decode_presence_fields(fields):
+    """
+    Converts presence CSV fields into (user_id, date, start, end) tuple.
+
+    Fields in the usual fixed-width format are sliced into integers
+    directly, any other go through strptime. Raises ValueError for wrong
+    values.
+    """
+    user_id, day, start, end = fields
+    if (len(day) == 10 and len(start) == 8 and len(end) == 8 and
+            day[4] == day[7] == '-' and
+            start[2] == start[5] == end[2] == end[5] == ':'):
+        try:
+            return (
+                int(user_id),
+                dt_date(int(day[:4]), int(day[5:7]), int(day[8:])),
+                dt_time(int(start[:2]), int(start[3:5]), int(start[6:])),
+                dt_time(int(end[:2]), int(end[3:5]), int(end[6:])),
+            )
+        except ValueError:
+            pass
+
+    try:
+        return (
+            int(user_id),
+            datetime.strptime(day, '%Y-%m-%d').date(),
+            datetime.strptime(start, '%H:%M:%S').time(),
+            datetime.strptime(end, '%H:%M:%S').time(),
+        )
+    except TypeError as error:
+        raise ValueError(error)
+
+
+def count_rejected(counters):
+    """ Increments counter of rejected lines, if counters are given. """
+    if counters is not None:
+        counters['rejected'] = counters.get('rejected', 0) + 1
+
+
+def count_duplicate(counters):
+    """ Increments counter of duplicated dates, if counters are given. """
+    if counters is not None:
+        counters['duplicates'] = counters.get('duplicates', 0) + 1
+
+
+def validate_presence_lines(lines, counters=None):
+    """
+    First stage of presence parse pipeline.
+
+    Yields (line number, fields) for lines with the right number of fields,
+    other non-empty lines are counted as 'rejected' in given counters dict.
+    """
+    for i, line in enumerate(lines):
+        fields = split_presence_line(line)
+        if fields is not None:
+            yield i, fields
+        elif line.strip():
+            count_rejected(counters)
+
+
+def decode_presence_rows(numbered_fields, counters=None):
+    """
+    Second stage of presence parse pipeline.
+
+    Yields (user_id, date, start, end) tuples, fields with wrong values are
+    skipped and counted as 'rejected' in given counters dict.
+    """
+    for i, fields in numbered_fields:
+        try:
+            yield decode_presence_fields(fields)
+        except ValueError:
+            LOG.debug('Problem with line %d: ', i, exc_info=True)
+            count_rejected(counters)
+
+
+def parse_presence_rows(lines, counters=None):
+    """
+    Parses presence CSV lines.
+
+    Yields (user_id, date, start, end) tuples for every correct row, lines
+    with a wrong number of fields (header, footer) or wrong values are
+    skipped and counted as 'rejected' in given counters dict.
+    """
+    return decode_presence_rows(validate_presence_lines(lines, counters),
+                                counters)
+
+
+WeekdayStats = namedtuple('WeekdayStats', 'count interval start end')
+EMPTY_WEEKDAY_STATS = WeekdayStats(0, 0, 0, 0)
+
+
+def update_weekday_stats(stats, date, start, end, sign=1):
+    """
+    Adds (or with negative sign removes) one presence entry to the list of
+    per weekday sums.
+    """
+    add_weekday_seconds(stats, date.weekday(), seconds_since_midnight(start),
+                        seconds_since_midnight(end), sign)
+
+
+def add_weekday_seconds(stats, weekday, start, end, sign=1):
+    """
+    Adds (or with negative sign removes) presence entry given as start and
+    end seconds since midnight to sums of given weekday.
+    """
+    current = stats[weekday]
+    stats[weekday] = WeekdayStats(
+        current.count + sign,
+        current.interval + sign * (end - start),
+        current.start + sign * start,
+        current.end + sign * end,
+    )
+
+
+DAY_SECONDS = 24 * 3600
+
+
+def aggregate_presence_rows(rows, track_duplicates=True):
+    """
+    Last stage of presence parse pipeline.
+
+    Folds (user_id, date, start, end) rows into lists of WeekdayStats of
+    every user without keeping presence entries.
+
+    With track_duplicates start and end seconds of every entry are
+    remembered, packed in one integer per user and date, so a repeated date
+    replaces the previous entry like in get_data() wherever it appears in
+    the file. Without track_duplicates only the sums are kept.
+    """
+    aggregates = {}
+    entries = {}
+    for user_id, date, start, end in rows:
+        stats = aggregates.get(user_id)
+        if stats is None:
+            stats = aggregates[user_id] = [EMPTY_WEEKDAY_STATS] * 7
+        weekday = date.weekday()
+        start = seconds_since_midnight(start)
+        end = seconds_since_midnight(end)
+
+        if track_duplicates:
+            user_entries = entries.get(user_id)
+            if user_entries is None:
+                user_entries = entries[user_id] = {}
+            day = date.toordinal()
+            previous = user_entries.get(day)
+            if previous is not None:
+                add_weekday_seconds(stats, weekday,
+                                    *divmod(previous, DAY_SECONDS), sign=-1)
+            user_entries[day] = start * DAY_SECONDS + end
+
+        add_weekday_seconds(stats, weekday, start, end)
+    return aggregates
+
+
+def stream_weekday_stats(path, track_duplicates=True, counters=None):
+    """
+    Computes WeekdayStats of all users reading presence CSV file line by
+    line, see aggregate_presence_rows().
+    """
+    with open(path, 'rb') as csvfile:
+        return aggregate_presence_rows(
+            parse_presence_rows(csvfile, counters), track_duplicates
+        )
+
+
+@cache(24 * 3600, max_entries=1)
+def load_weekday_stats(path, size, mtime):  # pylint: disable=unused-argument
+    """
+    Streams presence CSV file into weekday stats of all users. Size and
+    modification time of the file are only a part of cache key.
+    """
+    return stream_weekday_stats(path)
+
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+DUPLICATE_POLICIES = ('last', 'first', 'longest', 'span')
+
+
+def resolve_duplicate(previous, entry, policy='last'):
+    """
+    Returns presence entry kept when a user has two entries for one date:
+    the later one ('last'), the earlier one ('first'), the one with longer
+    presence ('longest') or one spanning both of them ('span').
+    """
+    if policy == 'last':
+        return entry
+    if policy == 'first':
+        return previous
+    if policy == 'longest':
+        if (interval(entry['start'], entry['end']) >
+                interval(previous['start'], previous['end'])):
+            return entry
+        return previous
+    if policy == 'span':
+        return {'start': min(previous['start'], entry['start']),
+                'end': max(previous['end'], entry['end'])}
+    raise ValueError('Unknown duplicates policy: {}'.format(policy))
+
+
+def add_presence_rows(rows, data, aggregates, policy='last', counters=None):
+    """
+    Adds (user_id, date, start, end) rows to presence data in get_data()
+    format and to lists of WeekdayStats of users. Rows for a user and date
+    which is already present are resolved with given duplicates policy and
+    counted as 'duplicates' in given counters dict.
+
+    Structures of every user are copied before the first change, so the ones
+    shared with other readers stay intact.
+    """
+    copied = set()
+    for user_id, date, start, end in rows:
+        if user_id not in copied:
+            data[user_id] = dict(data.get(user_id, {}))
+            aggregates[user_id] = list(
+                aggregates.get(user_id, [EMPTY_WEEKDAY_STATS] * 7)
+            )
+            copied.add(user_id)
+
+        entry = {'start': start, 'end': end}
+        previous = data[user_id].get(date)
+        if previous is not None:
+            count_duplicate(counters)
+            entry = resolve_duplicate(previous, entry, policy)
+            update_weekday_stats(aggregates[user_id], date,
+                                 previous['start'], previous['end'], -1)
+        update_weekday_stats(aggregates[user_id], date, entry['start'],
+                             entry['end'])
+        data[user_id][date] = entry
+
+
+def merge_presence_results(results, policy='last', counters=None):
+    """
+    Merges (data, aggregates) pairs parsed from consecutive parts of input
+    into one. Dates of a user present in many parts are resolved with given
+    duplicates policy and counted as 'duplicates' in given counters dict.
+    Merged pairs are not modified.
+    """
+    data = {}
+    aggregates = {}
+    for part_data, part_aggregates in results:
+        for user_id, entries in part_data.iteritems():
+            user_data = data.get(user_id)
+            if user_data is None:
+                data[user_id] = dict(entries)
+                aggregates[user_id] = list(part_aggregates[user_id])
+                continue
+
+            stats = [
+                WeekdayStats(*[a + b for a, b in zip(item, part_item)])
+                for item, part_item in zip(aggregates[user_id],
+                                           part_aggregates[user_id])
+            ]
+            kept = {}
+            for date in user_data.viewkeys() & entries.viewkeys():
+                count_duplicate(counters)
+                kept[date] = resolve_duplicate(user_data[date], entries[date],
+                                               policy)
+                for item, sign in ((user_data[date], -1),
+                                   (entries[date], -1), (kept[date], 1)):
+                    update_weekday_stats(stats, date, item['start'],
+                                         item['end'], sign)
+            user_data.update(entries)
+            user_data.update(kept)
+            aggregates[user_id] = stats
+    return data, aggregates
+
+
+def split_into_chunks(path, size, parts):
+    """
+    Splits first size bytes of a file into at most given number of chunks
+    starting at line boundaries. Only complete lines are covered, returns
+    list of (start, end) offsets.
+    """
+    with open(path, 'rb') as csvfile:
+        tail_start = max(0, size - 64 * 1024)
+        csvfile.seek(tail_start)
+        end = tail_start + csvfile.read(size - tail_start).rfind('\n') + 1
+        if end <= tail_start:
+            return []
+
+        offsets = [0]
+        for part in range(1, parts):
+            csvfile.seek(end * part // parts)
+            csvfile.readline()
+            if offsets[-1] < csvfile.tell() < end:
+                offsets.append(csvfile.tell())
+    return zip(offsets, offsets[1:] + [end])
+
+
+def add_counters(counters, other):
+    """ Adds values of other counters dict to given one, if it is given. """
+    if counters is not None:
+        for name, value in other.iteritems():
+            counters[name] = counters.get(name, 0) + value
+
+
+def parse_presence_chunk(chunk):
+    """
+    Parses (path, start, end, policy) chunk of presence CSV file. Returns
+    presence data, WeekdayStats of users and counters of rejected lines and
+    duplicated dates.
+    """
+    path, start, end, policy = chunk
+    data = {}
+    aggregates = {}
+    counters = {'rejected': 0, 'duplicates': 0}
+    with open(path, 'rb') as csvfile:
+        csvfile.seek(start)
+        lines = csvfile.read(end - start).splitlines(True)
+    add_presence_rows(parse_presence_rows(lines, counters), data, aggregates,
+                      policy, counters)
+    return data, aggregates, counters
+
+
+def load_presence_chunks(path, size, workers, chunk_size=CHUNK_SIZE,
+                         policy='last', counters=None):
+    """
+    Parses complete lines of presence CSV file in a pool of processes, each
+    of them parsing a chunk of at least chunk_size bytes. Chunk results are
+    merged in file order with given duplicates policy, like in a serial load.
+    Rejected lines and duplicated dates are added to given counters dict.
+
+    Returns presence data, WeekdayStats of users and offset where parsing
+    ended.
+    """
+    parts = min(workers, size // max(chunk_size, 1))
+    if parts < 2:
+        return {}, {}, 0
+
+    chunks = split_into_chunks(path, size, parts)
+    if not chunks:
+        # no line ends near the end of file, it is left to a serial parse
+        return {}, {}, 0
+
+    pool = multiprocessing.Pool(min(workers, len(chunks)))
+    try:
+        results = pool.map(parse_presence_chunk, [
+            (path, start, end, policy) for start, end in chunks
+        ])
+    finally:
+        pool.close()
+        pool.join()
+
+    for _, _, chunk_counters in results:
+        add_counters(counters, chunk_counters)
+    data, aggregates = merge_presence_results(
+        [result[:2] for result in results], policy, counters
+    )
+    return data, aggregates, chunks[-1][1]
+
+
+def is_presence_pattern(path):
+    """
+    Checks if DATA_CSV names many presence files: a directory, a glob
+    pattern or a gzip-compressed file.
+    """
+    return (os.path.isdir(path) or glob.has_magic(path) or
+            path.endswith('.gz'))
+
+
+def list_presence_files(pattern):
+    """
+    Returns sorted paths of presence files given as a directory (its .csv
+    and .csv.gz files), a glob pattern or a single file.
+    """
+    if os.path.isdir(pattern):
+        paths = (glob.glob(os.path.join(pattern, '*.csv')) +
+                 glob.glob(os.path.join(pattern, '*.csv.gz')))
+    else:
+        paths = glob.glob(pattern)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def presence_source_paths(source):
+    """ Returns paths of presence files named by DATA_CSV. """
+    if is_presence_pattern(source):
+        return list_presence_files(source)
+    return [source]
+
+
+def open_presence_file(path):
+    """ Opens presence CSV file, gzip-compressed if its name ends with .gz. """
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def parse_presence_file(source):
+    """
+    Parses (path, policy) presence CSV file, gzip-compressed if its name
+    ends with .gz. Returns presence data, WeekdayStats of users and
+    counters of rejected lines and duplicated dates.
+    """
+    path, policy = source
+    data = {}
+    aggregates = {}
+    counters = {'rejected': 0, 'duplicates': 0}
+    with open_presence_file(path) as csvfile:
+        add_presence_rows(parse_presence_rows(csvfile, counters), data,
+                          aggregates, policy, counters)
+    return data, aggregates, counters
+
+
+def complete_lines(csvfile, position):
+    """
+    Yields complete lines of a file which may still be written, moving
+    position (a one item list) past them. Unterminated last line is left
+    for the next read.
+    """
+    for line in csvfile:
+        if not line.endswith('\n'):
+            break
+        position[0] += len(line)
+        yield line
+
+
+class AppendOnlyFile(object):
+    """
+    Base class of structures built from a file which only grows.
+
+    Subclasses implement refresh(path, stat, **options), parsing the whole
+    file or, when is_appended() says so, only the part after offset. A file
+    which was truncated, replaced or rewritten in place must be parsed from
+    scratch.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.path = None
+        self.inode = None
+        self.size = None
+        self.mtime = None
+        self.offset = 0
+        self.generation = 0
+
+    def is_fresh(self, path, stat):
+        """ Checks if loaded data reflects given file state. """
+        return (self.path == path and self.inode == stat.st_ino and
+                self.size == stat.st_size and self.mtime == stat.st_mtime)
+
+    def is_appended(self, path, stat):
+        """ Checks if the file only grew since it was loaded. """
+        return (self.path == path and self.inode == stat.st_ino and
+                self.size < stat.st_size)
+
+    def follow(self, path, **options):
+        """
+        Refreshes loaded data if the file changed. Options are passed to
+        refresh().
+        """
+        stat = os.stat(path)
+        if self.is_fresh(path, stat):
+            return
+
+        with self.lock:
+            stat = os.stat(path)
+            if not self.is_fresh(path, stat):
+                self.refresh(path, stat, **options)
+
+    def mark_loaded(self, path, stat, offset):
+        """
+        Remembers state of the file after refresh. Must be called after the
+        refreshed data is published, as readers checking is_fresh() without
+        locking take the data they find.
+        """
+        self.path = path
+        self.offset = offset
+        self.inode = stat.st_ino
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.generation += 1
+
+    def invalidate(self):
+        """
+        Forgets state of the loaded file, so the next follow() parses it from
+        scratch.
+        """
+        self.path = None
+
+    def refresh(self, path, stat, **options):
+        """ Parses the whole file or only its appended part. """
+        raise NotImplementedError
+
+
+class PresenceStore(AppendOnlyFile):
+    """
+    Process-wide presence data loaded from the CSV file.
+
+    The file is parsed once, afterwards only its appended tail is parsed when
+    the size or modification time changes.
+
+    Lines which could not be parsed are counted in the rejected attribute,
+    dates present more than once (resolved with duplicates policy) in the
+    duplicates attribute. Change of the policy reloads the whole file.
+
+    Together with the data the store keeps per user and weekday sums of
+    presence entries, updated with every parsed row.
+
+    Loaded data is never modified in place, every change publishes a new
+    structure, so readers can use it without locking.
+    """
+
+    def __init__(self):
+        super(PresenceStore, self).__init__()
+        self.rejected = 0
+        self.duplicates = 0
+        self.policy = None
+        self.data = {}
+        self.aggregates = {}
+
+    def load(self, path, workers=1, chunk_size=CHUNK_SIZE, policy='last'):
+        """
+        Returns presence data of given CSV file, refreshed if needed. The whole
+        file is parsed by given number of processes, in chunks of at least
+        chunk_size bytes.
+        """
+        if self.policy != policy:
+            with self.lock:
+                if self.policy != policy:
+                    self.invalidate()
+        self.follow(path, workers=workers, chunk_size=chunk_size,
+                    policy=policy)
+        return self.data
+
+    def refresh(self, path, stat, workers=1, chunk_size=CHUNK_SIZE,
+                policy='last'):
+        """ Parses the whole file or only its appended part. """
+        # pylint: disable=arguments-differ
+        if self.is_appended(path, stat):
+            data = dict(self.data)
+            aggregates = dict(self.aggregates)
+            offset = self.offset
+            counters = {'rejected': self.rejected,
+                        'duplicates': self.duplicates}
+        else:
+            counters = {'rejected': 0, 'duplicates': 0}
+            data, aggregates, offset = load_presence_chunks(
+                path, stat.st_size, workers, chunk_size, policy, counters
+            )
+
+        position = [offset]
+        with open(path, 'rb') as csvfile:
+            csvfile.seek(offset)
+            add_presence_rows(
+                parse_presence_rows(complete_lines(csvfile, position),
+                                    counters),
+                data, aggregates, policy, counters
+            )
+
+        self.rejected = counters['rejected']
+        self.duplicates = counters['duplicates']
+        self.policy = policy
+        self.data = data
+        self.aggregates = aggregates
+        self.mark_loaded(path, stat, position[0])
+
+
+class PresenceIndex(AppendOnlyFile):
+    """
+    Byte ranges of presence CSV lines of every user.
+
+    Only user ids are read while indexing, so unknown users are recognized
+    and a single user's rows are read without parsing the whole file.
+    Consecutive lines of the same user are merged into one range. Appended
+    lines are indexed incrementally, an unterminated last line is left for
+    the next refresh.
+    """
+
+    def __init__(self):
+        super(PresenceIndex, self).__init__()
+        self.ranges = {}
+
+    def load(self, path):
+        """ Returns ranges of given CSV file, refreshed if needed. """
+        self.follow(path)
+        return self.ranges
+
+    def refresh(self, path, stat, **options):
+        """ Indexes the whole file or only its appended part. """
+        if self.is_appended(path, stat):
+            ranges = dict(self.ranges)
+            position = [self.offset]
+        else:
+            ranges = {}
+            position = [0]
+
+        copied = set()
+        with open(path, 'rb') as csvfile:
+            csvfile.seek(position[0])
+            for line in complete_lines(csvfile, position):
+                start = position[0] - len(line)
+                try:
+                    user_id = int(line.split(',', 1)[0])
+                except ValueError:
+                    continue
+
+                if user_id not in copied:
+                    ranges[user_id] = list(ranges.get(user_id, []))
+                    copied.add(user_id)
+                user_ranges = ranges[user_id]
+                if user_ranges and user_ranges[-1][1] == start:
+                    user_ranges[-1] = (user_ranges[-1][0], position[0])
+                else:
+                    user_ranges.append((start, position[0]))
+
+        self.ranges = ranges
+        self.mark_loaded(path, stat, position[0])
+
+    def read_user_data(self, user_id):
+        """
+        Reads presence entries of given user in get_data() format, or None
+        for an unknown user.
+        """
+        ranges = self.ranges.get(user_id)
+        if ranges is None:
+            return None
+
+        data = {}
+        with open(self.path, 'rb') as csvfile:
+            for start, end in ranges:
+                csvfile.seek(start)
+                lines = csvfile.read(end - start).splitlines(True)
+                for row in parse_presence_rows(lines):
+                    data[row[1]] = {'start': row[2], 'end': row[3]}
+        return data
+
+
+class PresenceSources(object):
+    """
+    Process-wide presence data merged from many CSV files.
+
+    Every file is parsed into its own presence data and aggregates, which
+    are kept until the file changes, so only new and changed files are
+    parsed again. Files are merged in the order of their names, dates
+    present in many files are resolved with duplicates policy.
+
+    Like in PresenceStore, loaded data is never modified in place.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.key = None
+        self.files = {}
+        self.rejected = 0
+        self.duplicates = 0
+        self.generation = 0
+        self.data = {}
+        self.aggregates = {}
+
+    def load(self, pattern, workers=1, policy='last'):
+        """
+        Returns presence data of files matching given pattern, refreshed if
+        needed. Changed files are parsed by given number of processes.
+        """
+        key = (policy, presence_files_version(pattern))
+        if key != self.key:
+            with self.lock:
+                key = (policy, presence_files_version(pattern))
+                if key != self.key:
+                    self.refresh(key, workers)
+        return self.data
+
+    def refresh(self, key, workers):
+        """ Parses new and changed files and merges all of them. """
+        policy, versions = key
+        files = {}
+        sources = []
+        for version in versions:
+            cached = self.files.get(version[0])
+            if cached is not None and cached[0] == (policy, version):
+                files[version[0]] = cached
+            else:
+                sources.append(version)
+        LOG.info('Parsing %d of %d presence files', len(sources),
+                 len(versions))
+
+        arguments = [(version[0], policy) for version in sources]
+        if workers > 1 and len(arguments) > 1:
+            pool = multiprocessing.Pool(min(workers, len(arguments)))
+            try:
+                results = pool.map(parse_presence_file, arguments)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [parse_presence_file(argument)
+                       for argument in arguments]
+        for version, result in zip(sources, results):
+            files[version[0]] = ((policy, version),) + result
+
+        counters = {'rejected': 0, 'duplicates': 0}
+        for version in versions:
+            add_counters(counters, files[version[0]][3])
+        data, aggregates = merge_presence_results(
+            [files[version[0]][1:3] for version in versions], policy,
+            counters
+        )
+
+        # key is set last, readers checking it without locking take the
+        # data they find
+        self.files = files
+        self.rejected = counters['rejected']
+        self.duplicates = counters['duplicates']
+        self.data = data
+        self.aggregates = aggregates
+        self.generation += 1
+        self.key = key
+
+
+PRESENCE_STORE = PresenceStore()
+
+PRESENCE_SOURCES = PresenceSources()
+
+PRESENCE_INDEX = PresenceIndex()
+
+
+@timed
 def get_data():
     """
     Extracts presence data from CSV file and groups it by user_id.
@@ -83,28 +1117,473 @@ def get_data():
             },
         }
     }
+
+    DATA_CSV can also name many files (see is_presence_pattern()), which
+    are merged. Dates present more than once are resolved with DATA_DUPLICATES
+    policy.
+
+    Data is kept in the process-wide store and shared between callers,
+    so it must not be modified.
     """
-    data = {}
-    with open(app.config['DATA_CSV'], 'r') as csvfile:
-        presence_reader = csv.reader(csvfile, delimiter=',')
-        for i, row in enumerate(presence_reader):
-            if len(row) != 4:
-                # ignore header and footer lines
-                continue
+    path = app.config['DATA_CSV']
+    workers = app.config.get('DATA_LOAD_WORKERS', 1)
+    policy = app.config.get('DATA_DUPLICATES', 'last')
+    if is_presence_pattern(path):
+        return PRESENCE_SOURCES.load(path, workers=workers, policy=policy)
+    return PRESENCE_STORE.load(
+        path, workers=workers,
+        chunk_size=app.config.get('DATA_LOAD_CHUNK_SIZE', CHUNK_SIZE),
+        policy=policy,
+    )
 
-            try:
-                user_id = int(row[0])
-                date = datetime.strptime(row[1], '%Y-%m-%d').date()
-                start = datetime.strptime(row[2], '%H:%M:%S').time()
-                end = datetime.strptime(row[3], '%H:%M:%S').time()
-            except (ValueError, TypeError):
-                LOG.debug('Problem with line %d: ', i, exc_info=True)
 
-            data.setdefault(user_id, {})[date] = {'start': start, 'end': end}
+def get_store():
+    """
+    Returns process-wide store of presence data read from DATA_CSV, loaded
+    by get_data().
+    """
+    if is_presence_pattern(app.config['DATA_CSV']):
+        return PRESENCE_SOURCES
+    return PRESENCE_STORE
+
+
+class PresenceColumns(object):
+    """
+    Presence data kept in typed arrays sorted by user_id and date.
+
+    Every presence entry takes four 32-bit integers: user_id, proleptic
+    Gregorian ordinal of the date and start and end seconds since midnight.
+    """
+
+    def __init__(self, user_ids, days, starts, ends):
+        self.user_ids = user_ids
+        self.days = days
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Creates columns from (user_id, date, start, end) rows. Later rows
+        replace earlier ones for the same user and date.
+        """
+        columns = [array.array('i') for _ in range(4)]
+        for user_id, date, start, end in rows:
+            columns[0].append(user_id)
+            columns[1].append(date.toordinal())
+            columns[2].append(seconds_since_midnight(start))
+            columns[3].append(seconds_since_midnight(end))
+        user_ids, days, starts, ends = [
+            numpy.frombuffer(column, dtype=numpy.int32)
+            if column else numpy.zeros(0, dtype=numpy.int32)
+            for column in columns
+        ]
+
+        # stable sort keeps file order of duplicates, the last one wins
+        order = numpy.lexsort((days, user_ids))
+        user_ids, days = user_ids[order], days[order]
+        last = numpy.ones(len(order), dtype=bool)
+        last[:-1] = (user_ids[1:] != user_ids[:-1]) | (days[1:] != days[:-1])
+        order = order[last]
+        return cls(user_ids[last], days[last], starts[order], ends[order])
+
+    @classmethod
+    def from_data(cls, data):
+        """ Creates columns from presence entries in get_data() format. """
+        return cls.from_rows(
+            (user_id, date, item['start'], item['end'])
+            for user_id, items in data.iteritems()
+            for date, item in items.iteritems()
+        )
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def user_range(self, user_id):
+        """ Returns slice bounds of rows of given user. """
+        return (int(numpy.searchsorted(self.user_ids, user_id, 'left')),
+                int(numpy.searchsorted(self.user_ids, user_id, 'right')))
+
+    def users(self):
+        """ Returns sorted array of user ids. """
+        return numpy.unique(self.user_ids)
+
+    def weekdays(self, low=0, high=None):
+        """ Returns weekday numbers (Monday is 0) of given rows. """
+        return (self.days[low:high] - 1) % 7
+
+    def weekday_stats(self, user_id):
+        """
+        Returns list of WeekdayStats of given user computed with vectorized
+        reductions, or None if the user has no presence data.
+        """
+        low, high = self.user_range(user_id)
+        if low == high:
+            return None
+
+        return vectorized_weekday_stats(self.days[low:high],
+                                        self.starts[low:high],
+                                        self.ends[low:high])
+
+    def to_dict(self, user_id):
+        """ Returns presence entries of given user in get_data() format. """
+        low, high = self.user_range(user_id)
+        return columns_to_dict(self.days[low:high], self.starts[low:high],
+                               self.ends[low:high])
+
+
+def vectorized_weekday_stats(days, starts, ends):
+    """
+    Computes list of WeekdayStats from arrays of date ordinals, start and end
+    seconds with vectorized reductions.
+    """
+    weekdays = (days - 1) % 7
+    sums = [numpy.bincount(weekdays, minlength=7)] + [
+        numpy.bincount(weekdays, weights=weights, minlength=7)
+        for weights in (ends - starts, starts, ends)
+    ]
+    return [WeekdayStats(*[int(column[weekday]) for column in sums])
+            for weekday in range(7)]
+
+
+def columns_to_dict(days, starts, ends):
+    """
+    Converts arrays of date ordinals, start and end seconds into presence
+    entries in get_data() format.
+    """
+    return dict(
+        (datetime.fromordinal(int(day)).date(), {
+            'start': seconds_to_time(int(start)),
+            'end': seconds_to_time(int(end)),
+        })
+        for day, start, end in zip(days, starts, ends)
+    )
+
+
+@cache(24 * 3600, max_entries=1)
+def load_columns(path, size, mtime):  # pylint: disable=unused-argument
+    """
+    Loads presence CSV file into columns. Size and modification time of the
+    file are only a part of cache key.
+    """
+    with open(path, 'rb') as csvfile:
+        return PresenceColumns.from_rows(parse_presence_rows(csvfile))
+
+
+def get_columns():
+    """ Returns columnar presence data of current CSV file. """
+    path = app.config['DATA_CSV']
+    stat = os.stat(path)
+    return load_columns(path, stat.st_size, stat.st_mtime)
+
+
+def file_version(path):
+    """ Returns token identifying state of a file. """
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_ino, stat.st_mtime
+
 
-    return data
+def presence_files_version(pattern):
+    """ Returns token identifying state of presence files. """
+    return tuple(file_version(path) for path in list_presence_files(pattern))
 
 
+def data_version():
+    """
+    Returns token identifying current presence data: PRESENCE_BACKEND,
+    duplicates policy and state of the files the backend may read. Backend
+    falling back to other one (see presence_analyzer.backends.get_backend())
+    reads the same files, so the token changes together with its data.
+    """
+    backend = app.config.get('PRESENCE_BACKEND')
+    policy = app.config.get('DATA_DUPLICATES', 'last')
+    path = app.config['DATA_CSV']
+    if is_presence_pattern(path):
+        return backend, policy, presence_files_version(path)
+    if backend == 'snapshot':
+        # stale snapshot is replaced by the CSV file, if there is one
+        paths = [app.config['DATA_SNAPSHOT']]
+        if os.path.exists(path):
+            paths.append(path)
+        return backend, policy, tuple(file_version(item) for item in paths)
+    return backend, policy, (file_version(path),)
+
+
+class UserRangeIndex(object):
+    """
+    Presence entries of one user split by weekday and sorted by date, with
+    prefix sums of WeekdayStats of every weekday, so stats of any date range
+    take two binary searches and a subtraction per weekday. Every entry
+    takes its date and four sums.
+    """
+
+    def __init__(self, items):
+        dates = sorted(items)
+        days = numpy.array([date.toordinal() for date in dates],
+                           dtype=numpy.int32)
+        weekdays = (days - 1) % 7
+        starts = numpy.array(
+            [seconds_since_midnight(items[date]['start']) for date in dates],
+            dtype=numpy.int64
+        )
+        ends = numpy.array(
+            [seconds_since_midnight(items[date]['end']) for date in dates],
+            dtype=numpy.int64
+        )
+
+        # (days, sums) of every weekday, sums[i] holds stats of the first
+        # i entries of the weekday
+        self.weekdays = []
+        for weekday in range(7):
+            mask = weekdays == weekday
+            sums = numpy.zeros((int(mask.sum()) + 1, 4), dtype=numpy.int64)
+            sums[1:, 0] = 1
+            sums[1:, 1] = ends[mask] - starts[mask]
+            sums[1:, 2] = starts[mask]
+            sums[1:, 3] = ends[mask]
+            self.weekdays.append((days[mask], sums.cumsum(axis=0)))
+
+    def weekday_stats(self, date_from=None, date_to=None):
+        """
+        Returns list of WeekdayStats of entries between given dates
+        (inclusive), open ends are not limited.
+        """
+        stats = []
+        for days, sums in self.weekdays:
+            low = 0
+            high = len(days)
+            if date_from is not None:
+                low = int(numpy.searchsorted(days, date_from.toordinal(),
+                                             'left'))
+            if date_to is not None:
+                high = int(numpy.searchsorted(days, date_to.toordinal(),
+                                              'right'))
+            stats.append(WeekdayStats(*[
+                int(value) for value in sums[max(high, low)] - sums[low]
+            ]))
+        return stats
+
+
+HISTOGRAM_BIN_SIZE = 15 * 60
+
+
+def slot_labels(slot_size):
+    """ Returns HH:MM start times of time slots of a day. """
+    return [seconds_to_time(seconds).strftime('%H:%M')
+            for seconds in range(0, 24 * 3600, slot_size)]
+
+
+class CompanyStats(object):
+    """
+    Presence aggregates of all users: WeekdayStats of all entries,
+    histograms of start and end times and number of present users on every
+    date (given as arrays of date ordinals and headcounts).
+    """
+
+    def __init__(self, weekday_stats, start_histogram, end_histogram, dates,
+                 headcounts, bin_size=HISTOGRAM_BIN_SIZE):
+        # pylint: disable=too-many-arguments
+        self.bin_size = bin_size
+        self.weekday_stats = weekday_stats
+        self.start_histogram = start_histogram
+        self.end_histogram = end_histogram
+        self.dates = dates
+        self.headcounts = headcounts
+
+    @classmethod
+    def from_columns(cls, columns, date_from=None, date_to=None,
+                     bin_size=HISTOGRAM_BIN_SIZE):
+        """
+        Computes aggregates of entries between given dates (inclusive) with
+        vectorized reductions over columnar data.
+        """
+        days, starts, ends = columns.days, columns.starts, columns.ends
+        if date_from is not None or date_to is not None:
+            mask = numpy.ones(len(days), dtype=bool)
+            if date_from is not None:
+                mask &= days >= date_from.toordinal()
+            if date_to is not None:
+                mask &= days <= date_to.toordinal()
+            days, starts, ends = days[mask], starts[mask], ends[mask]
+
+        bins = -(-24 * 3600 // bin_size)
+        start_histogram, end_histogram = [
+            numpy.bincount(times // bin_size, minlength=bins)
+            for times in (starts, ends)
+        ]
+        # every user has at most one entry a day
+        dates, headcounts = numpy.unique(days, return_counts=True)
+        return cls(vectorized_weekday_stats(days, starts, ends),
+                   start_histogram, end_histogram, dates, headcounts,
+                   bin_size)
+
+    def histogram_result(self):
+        """ Returns numbers of starts and ends in every time bin. """
+        result = [
+            (label, int(starts), int(ends))
+            for label, starts, ends in zip(slot_labels(self.bin_size),
+                                           self.start_histogram,
+                                           self.end_histogram)
+        ]
+        result.insert(0, ('Time', 'Starts', 'Ends'))
+        return result
+
+    def headcount_result(self):
+        """ Returns number of present users on every date. """
+        result = [
+            (dt_date.fromordinal(int(day)).isoformat(), int(headcount))
+            for day, headcount in zip(self.dates, self.headcounts)
+        ]
+        result.insert(0, ('Date', 'Users'))
+        return result
+
+
+class OccupancyIndex(object):
+    """
+    Number of present users in every time slot of every date.
+
+    Every presence entry adds one at its first slot and subtracts one after
+    its last slot of a per-date difference array, so a single cumulative sum
+    gives occupancy of all dates. A user is counted in every slot overlapping
+    the presence entry.
+    """
+
+    def __init__(self, dates, occupancy, slot_size=HISTOGRAM_BIN_SIZE):
+        self.slot_size = slot_size
+        self.dates = dates
+        self.occupancy = occupancy
+
+    @classmethod
+    def from_changes(cls, days, slots, changes, slot_size=HISTOGRAM_BIN_SIZE):
+        """
+        Builds the index from arrays of date ordinals, slot numbers and
+        changes of occupancy in those slots.
+        """
+        dates, rows = numpy.unique(days, return_inverse=True)
+        slot_count = -(-24 * 3600 // slot_size)
+        differences = numpy.zeros((len(dates), slot_count + 1),
+                                  dtype=numpy.int32)
+        numpy.add.at(differences, (rows, slots), changes)
+        return cls(dates, differences.cumsum(axis=1)[:, :slot_count],
+                   slot_size)
+
+    @classmethod
+    def from_columns(cls, columns, slot_size=HISTOGRAM_BIN_SIZE):
+        """ Builds the index of all entries of columnar data. """
+        first = columns.starts // slot_size
+        last = numpy.maximum(-(-columns.ends // slot_size), first)
+        return cls.from_changes(
+            numpy.concatenate((columns.days, columns.days)),
+            numpy.concatenate((first, last)),
+            numpy.concatenate((numpy.ones(len(first), dtype=numpy.int32),
+                               -numpy.ones(len(last), dtype=numpy.int32))),
+            slot_size
+        )
+
+    def date_range(self, date_from=None, date_to=None):
+        """ Returns row bounds of dates between given dates (inclusive). """
+        low = 0
+        high = len(self.dates)
+        if date_from is not None:
+            low = int(numpy.searchsorted(self.dates, date_from.toordinal(),
+                                         'left'))
+        if date_to is not None:
+            high = int(numpy.searchsorted(self.dates, date_to.toordinal(),
+                                          'right'))
+        return low, max(high, low)
+
+    def dates_result(self, date_from=None, date_to=None):
+        """ Returns occupancy of every slot of dates with presence data. """
+        low, high = self.date_range(date_from, date_to)
+        result = [
+            [dt_date.fromordinal(int(day)).isoformat()] + row.tolist()
+            for day, row in zip(self.dates[low:high],
+                                self.occupancy[low:high])
+        ]
+        result.insert(0, ['Date'] + slot_labels(self.slot_size))
+        return result
+
+    def weekday_result(self, weekday, date_from=None, date_to=None):
+        """
+        Returns mean and maximum occupancy in every slot of given weekday
+        (Monday is 0), counting dates with presence data only.
+        """
+        low, high = self.date_range(date_from, date_to)
+        occupancy = self.occupancy[low:high][
+            (self.dates[low:high] - 1) % 7 == weekday
+        ]
+        if len(occupancy):
+            means = occupancy.mean(axis=0).tolist()
+            maximums = occupancy.max(axis=0).tolist()
+        else:
+            means = maximums = [0] * occupancy.shape[1]
+        result = zip(slot_labels(self.slot_size), means, maximums)
+        result.insert(0, ('Time', 'Mean', 'Max'))
+        return result
+
+
+def get_date_range():
+    """
+    Returns dates given as 'from' and 'to' request arguments in YYYY-MM-DD
+    format, None for a missing one. Aborts with 400 for wrong dates.
+    """
+    result = []
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        try:
+            result.append(datetime.strptime(value, '%Y-%m-%d').date()
+                          if value else None)
+        except ValueError:
+            LOG.debug('Wrong %s date: %s', name, value)
+            abort(400)
+    return tuple(result)
+
+
+def weekday_mean_intervals(stats):
+    """ Calculates mean presence intervals from weekday stats. """
+    return [float(item.interval) / item.count if item.count else 0
+            for item in stats]
+
+
+def weekday_start_end_means(stats):
+    """ Calculates mean start and end times from weekday stats. """
+    return [
+        (get_time_from_seconds(int(float(item.start) / item.count)),
+         get_time_from_seconds(int(float(item.end) / item.count)))
+        if item.count else ([0, 0, 0], [0, 0, 0])
+        for item in stats
+    ]
+
+
+def mean_time_weekday_result(stats):
+    """ Returns mean presence time by weekday in API format. """
+    return [
+        (calendar.day_abbr[weekday], mean_interval)
+        for weekday, mean_interval in enumerate(weekday_mean_intervals(stats))
+    ]
+
+
+def presence_weekday_result(stats):
+    """ Returns total presence time by weekday in API format. """
+    result = [
+        (calendar.day_abbr[weekday], item.interval)
+        for weekday, item in enumerate(stats)
+    ]
+
+    result.insert(0, ('Weekday', 'Presence (s)'))
+    return result
+
+
+def presence_start_end_result(stats):
+    """ Returns mean start and end times by weekday in API format. """
+    start_end_means = weekday_start_end_means(stats)
+    return [
+        (calendar.day_abbr[weekday], intervals[0], intervals[1])
+        for weekday, intervals in enumerate(start_end_means)
+    ]
+
+
+@timed
 def group_by_weekday(items):
     """ Groups presence entries by weekday. """
     result = [[], [], [], [], [], [], []]  # one list for every day in week
@@ -130,6 +1609,7 @@ def mean(items):
     return float(sum(items)) / len(items) if len(items) > 0 else 0
 
 
+@timed
 def group_by_start_end_means(items):
     """ Groups presence entries by means of start and end times. """
     start_end_times = [{'day': date.weekday(),
@@ -145,6 +1625,7 @@ def group_by_start_end_means(items):
             for s, e in zip(start_means, end_means)]
 
 
+@timed
 def group_time_means(times, time_field):
     """
     Calculates mean if a time collection.
@@ -162,24 +1643,170 @@ def get_time_from_seconds(seconds):
     return [int(e) for e in str(timedelta(seconds=seconds)).split(':')]
 
 
-@cache(600)
+def seconds_to_time(seconds):
+    """ Converts seconds since midnight to datetime.time object. """
+    return dt_time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def set_users_locale():
+    """
+    Sets LC_COLLATE of the process to USERS_LOCALE, if it is given, so users
+    are sorted by names with its collation. Locale is process-wide and
+    setlocale() is not thread-safe, so it is called once at start, before
+    any thread is started.
+    """
+    users_locale = app.config.get('USERS_LOCALE')
+    if users_locale:
+        locale.setlocale(locale.LC_COLLATE, users_locale)
+
+
+def collation_key(name):
+    """ Returns sort key of a name according to current LC_COLLATE. """
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return locale.strxfrm(name)
+
+
+class UserDirectory(object):
+    """
+    Compact index of users from the users XML file.
+
+    The file is read with iterparse and every element is dropped right after
+    it is processed, so memory used while loading does not grow with the
+    file. Only user_id -> (name, avatar path) pairs are kept, avatar urls
+    are composed on lookup.
+
+    Users are sorted by name with collation of the current locale (see
+    set_users_locale()), the sorted listing is also kept serialized to JSON.
+    """
+
+    def __init__(self, path):
+        self.users = {}
+        self.server_url = None
+        # pylint: disable=no-member
+        for _, element in etree.iterparse(path, events=('end',)):
+            if element.tag == 'server':
+                self.server_url = '{}://{}:{}'.format(*[
+                    element.findtext(item)
+                    for item in ['protocol', 'host', 'port']
+                ])
+            elif element.tag == 'user':
+                _id = element.get('id')
+                name = element.findtext('name')
+                if _id and name:
+                    self.users[int(_id)] = (name, element.findtext('avatar'))
+            else:
+                continue
+
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+        self.sorted_ids = sorted(
+            self.users,
+            key=lambda user_id: collation_key(self.users[user_id][0])
+        )
+        self.ranks = dict(
+            (user_id, rank) for rank, user_id in enumerate(self.sorted_ids)
+        )
+        self.search_keys = sorted(
+            (name.lower(), user_id)
+            for user_id, (name, _) in self.users.iteritems()
+        )
+        self.listing_json = RawJSON(dumps(self.listing_dicts()))
+
+    def __len__(self):
+        return len(self.users)
+
+    def __contains__(self, user_id):
+        return user_id in self.users
+
+    def name(self, user_id):
+        """ Returns name of given user or None for an unknown user. """
+        return self.users.get(user_id, (None, None))[0]
+
+    def url(self, user_id):
+        """ Returns avatar url of given user or None. """
+        avatar = self.users.get(user_id, (None, None))[1]
+        if avatar is None or self.server_url is None:
+            return None
+        return self.server_url + avatar
+
+    def listing(self, user_ids=None):
+        """
+        Returns (user_id, name) pairs of all or given users sorted by name.
+        """
+        if user_ids is None:
+            user_ids = self.sorted_ids
+        return [(user_id, self.users[user_id][0]) for user_id in user_ids]
+
+    def listing_dicts(self, user_ids=None):
+        """ Returns listing() in /api/v1/users format. """
+        return [{'user_id': user_id, 'name': name}
+                for user_id, name in self.listing(user_ids)]
+
+    def search(self, prefix):
+        """
+        Returns ids of users whose names start with given prefix (ignoring
+        case), sorted by name.
+        """
+        prefix = prefix.lower()
+        found = []
+        index = bisect.bisect_left(self.search_keys, (prefix,))
+        while (index < len(self.search_keys) and
+               self.search_keys[index][0].startswith(prefix)):
+            found.append(self.search_keys[index][1])
+            index += 1
+        return sorted(found, key=self.ranks.get)
+
+    def to_dict(self):
+        """ Returns all users in get_users_from_xml() format. """
+        return dict(
+            (user_id, {u'name': self.name(user_id), u'url': self.url(user_id)})
+            for user_id in self.users
+        )
+
+
+@cache(24 * 3600, max_entries=1)
+def load_user_directory(path, version):  # pylint: disable=unused-argument
+    """
+    Loads UserDirectory from given XML file. File version is only a part of
+    cache key.
+    """
+    return UserDirectory(path)
+
+
+@timed
+def get_user_directory():
+    """ Returns UserDirectory of current users XML file. """
+    path = app.config['DATA_XML']
+    return load_user_directory(path, file_version(path))
+
+
+def start_users_refresher():
+    """
+    Starts thread downloading users XML file every USERS_REFRESH_INTERVAL
+    seconds and loading new UserDirectory right after the file changes.
+    Returns the thread, or None if refreshing is disabled.
+    """
+    interval = app.config.get('USERS_REFRESH_INTERVAL')
+    if not interval:
+        return None
+
+    refresher = UsersRefresher(app.config['USERS_URL'],
+                               app.config['DATA_XML'], interval,
+                               on_refresh=get_user_directory)
+    refresher.start()
+    return refresher
+
+
+@timed
 def get_users_from_xml():
     """  Extracts presence data from XML file and groups it by name. """
-    with open(app.config['DATA_XML'], 'r') as xmlfile:
-        # pylint: disable=no-member
-        root = etree.parse(xmlfile).getroot()
+    return users_dict(get_user_directory())
 
-        server = root.find("server")
-        url_parts = [server.findtext(item)
-                     for item in ["protocol", "host", "port", "location"]]
 
-        data = {}
-        for user in root.find("users").getchildren():
-            _id = user.get("id")
-            name = user.findtext("name")
-            url_parts[3] = user.findtext("avatar")
-            if _id and name:
-                # pylint: disable=star-args
-                data[int(_id)] = {u'name': name,
-                                  u'url': '{}://{}:{}{}'.format(*url_parts)}
-    return data
+@cache(24 * 3600, max_entries=1)
+def users_dict(directory):
+    """ Returns users of given UserDirectory as dict. """
+    return directory.to_dict()
@@ -3,24 +3,57 @@
 Defines views.
 """
 
-import calendar
 import logging
 
+from flask import Response
 from flask import abort
+from flask import g
 from flask import redirect
-from flask_mako import render_template
+from flask import request
+from json import dumps
 
+from presence_analyzer.backends import get_company_stats
+from presence_analyzer.backends import get_occupancy_index
+from presence_analyzer.backends import get_storage
+from presence_analyzer.backends import get_weekday_stats
 from presence_analyzer.main import app
-from presence_analyzer.utils import get_data
-from presence_analyzer.utils import get_users_from_xml
-from presence_analyzer.utils import group_by_start_end_means
-from presence_analyzer.utils import group_by_weekday
-from presence_analyzer.utils import mean
+from presence_analyzer.metrics import render_metrics
+from presence_analyzer.metrics import start_profile
+from presence_analyzer.metrics import stop_profile
+from presence_analyzer.reports import get_report
+from presence_analyzer.utils import file_version
+from presence_analyzer.utils import get_date_range
+from presence_analyzer.utils import get_user_directory
 from presence_analyzer.utils import jsonify
+from presence_analyzer.utils import jsonify_with
+from presence_analyzer.utils import mean_time_weekday_result
+from presence_analyzer.utils import presence_start_end_result
+from presence_analyzer.utils import presence_weekday_result
+from presence_analyzer.utils import render_page
+from presence_analyzer.warmup import WARMUP_STATUS
 
 log = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
+@app.before_request
+def start_request_profile():
+    """
+    Starts profiling of the request if PROFILING_ENABLED is set and the
+    request has X-Profile header.
+    """
+    if app.config['PROFILING_ENABLED'] and request.headers.get('X-Profile'):
+        g.profile = start_profile()
+
+
+@app.after_request
+def stop_request_profile(response):
+    """ Logs (and saves in PROFILE_DIR) profile of the request. """
+    profile = g.pop('profile', None)
+    if profile is not None:
+        stop_profile(profile, request.path, app.config['PROFILE_DIR'])
+    return response
+
+
 @app.route('/')
 def mainpage():
     """ Redirects to front page. """
@@ -30,48 +63,61 @@ def mainpage():
 @app.route('/api/v1/users', methods=['GET'])
 @jsonify
 def users_view():
-    """ Users listing for dropdown. """
-    data = get_users_from_xml()
-    data = [{'user_id': user_id, 'name': item.get('name')}
-            for user_id, item in data.items()]
-    return sorted(data,
-                  lambda item1, item2: cmp(item1.get("name"),
-                                           item2.get("name")))
+    """
+    Users listing for dropdown.
+
+    Listing can be limited to users whose names start with 'q' argument and
+    split into pages with 'page' (counted from 1) and 'per_page' arguments.
+    """
+    users = get_user_directory()
+    prefix = request.args.get('q')
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', type=int)
+    if not prefix and page is None and per_page is None:
+        return users.listing_json
+
+    user_ids = users.search(prefix) if prefix else users.sorted_ids
+    if page is not None or per_page is not None:
+        page = 1 if page is None else page
+        if per_page is None:
+            per_page = app.config['USERS_PER_PAGE']
+        if page < 1 or per_page < 1:
+            log.debug('Wrong page %s of %s users', page, per_page)
+            abort(400)
+        user_ids = user_ids[(page - 1) * per_page:page * per_page]
+    return users.listing_dicts(user_ids)
 
 
 @app.route('/api/v1/mean_time_weekday/<int:user_id>', methods=['GET'])
 @jsonify
 def mean_time_weekday_view(user_id):
-    """ Returns mean presence time of given user grouped by weekday. """
-    data = get_data()
-    if user_id not in data:
+    """
+    Returns mean presence time of given user grouped by weekday, optionally
+    limited to dates given as 'from' and 'to' arguments.
+    """
+    date_from, date_to = get_date_range()
+    stats = get_weekday_stats(user_id, date_from, date_to)
+    if stats is None:
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    weekdays = group_by_weekday(data[user_id])
-    return [
-        (calendar.day_abbr[weekday], mean(intervals))
-        for weekday, intervals in enumerate(weekdays)
-    ]
+    return mean_time_weekday_result(stats)
 
 
 @app.route('/api/v1/presence_weekday/<int:user_id>', methods=['GET'])
 @jsonify
 def presence_weekday_view(user_id):
-    """ Returns total presence time of given user grouped by weekday. """
-    data = get_data()
-    if user_id not in data:
+    """
+    Returns total presence time of given user grouped by weekday, optionally
+    limited to dates given as 'from' and 'to' arguments.
+    """
+    date_from, date_to = get_date_range()
+    stats = get_weekday_stats(user_id, date_from, date_to)
+    if stats is None:
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    weekdays = group_by_weekday(data[user_id])
-    result = [
-        (calendar.day_abbr[weekday], sum(intervals))
-        for weekday, intervals in enumerate(weekdays)
-    ]
-
-    result.insert(0, ('Weekday', 'Presence (s)'))
-    return result
+    return presence_weekday_result(stats)
 
 
 @app.route('/api/v1/presence_start_end/<int:user_id>', methods=['GET'])
@@ -79,45 +125,237 @@ def presence_weekday_view(user_id):
 def presence_start_end_view(user_id):
     """
     Returns presence of start and end mean time period of given user grouped by
-    weekday.
+    weekday, optionally limited to dates given as 'from' and 'to' arguments.
     """
-    data = get_data()
-    if user_id not in data:
+    date_from, date_to = get_date_range()
+    stats = get_weekday_stats(user_id, date_from, date_to)
+    if stats is None:
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    start_end_means = group_by_start_end_means(data[user_id])
-    return [
-        (calendar.day_abbr[weekday], intervals[0], intervals[1])
-        for weekday, intervals in enumerate(start_end_means)
-    ]
+    return presence_start_end_result(stats)
+
+
+def parse_user_id(value):
+    """
+    Converts user id given as integer or text. Raises ValueError for other
+    values, so fractions are not truncated.
+    """
+    if isinstance(value, (bool, float)):
+        raise ValueError('Wrong user id: {!r}'.format(value))
+    return int(value)
+
+
+@app.route('/api/v1/batch', methods=['GET', 'POST'])
+@jsonify
+def batch_view():
+    """
+    Returns weekday stats and picture url of many users at once.
+
+    User ids are given as comma separated 'user_ids' argument or as
+    'user_ids' list in posted JSON, stats can be limited to dates given as
+    'from' and 'to' arguments. Unknown users get None instead of stats.
+    """
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            log.debug('Wrong batch request: %s', payload)
+            abort(400)
+        user_ids = payload.get('user_ids')
+    else:
+        user_ids = request.args.get('user_ids', '').split(',')
+    try:
+        user_ids = [parse_user_id(user_id) for user_id in user_ids or []]
+    except (TypeError, ValueError):
+        log.debug('Wrong user ids: %s', user_ids)
+        abort(400)
+    if not user_ids or len(user_ids) > app.config['BATCH_MAX_USERS']:
+        log.debug('Wrong number of user ids: %s', len(user_ids))
+        abort(400)
+
+    date_from, date_to = get_date_range()
+    users = get_user_directory()
+    result = []
+    for user_id in user_ids:
+        stats = get_weekday_stats(user_id, date_from, date_to)
+        result.append({
+            'user_id': user_id,
+            'mean_time_weekday':
+                stats and mean_time_weekday_result(stats),
+            'presence_weekday': stats and presence_weekday_result(stats),
+            'presence_start_end':
+                stats and presence_start_end_result(stats),
+            'picture': users.url(user_id),
+        })
+    return result
+
+
+@app.route('/api/v1/company/mean_time_weekday', methods=['GET'])
+@jsonify
+def company_mean_time_weekday_view():
+    """
+    Returns mean presence time of all users grouped by weekday, optionally
+    limited to dates given as 'from' and 'to' arguments.
+    """
+    return mean_time_weekday_result(
+        get_company_stats(*get_date_range()).weekday_stats
+    )
+
+
+@app.route('/api/v1/company/presence_start_end', methods=['GET'])
+@jsonify
+def company_presence_start_end_view():  # pylint: disable=invalid-name
+    """
+    Returns mean start and end times of all users grouped by weekday,
+    optionally limited to dates given as 'from' and 'to' arguments.
+    """
+    return presence_start_end_result(
+        get_company_stats(*get_date_range()).weekday_stats
+    )
+
+
+@app.route('/api/v1/company/start_end_histogram', methods=['GET'])
+@jsonify
+def company_start_end_histogram_view():  # pylint: disable=invalid-name
+    """
+    Returns numbers of starts and ends of all users in 15 minute bins,
+    optionally limited to dates given as 'from' and 'to' arguments.
+    """
+    return get_company_stats(*get_date_range()).histogram_result()
+
+
+@app.route('/api/v1/company/headcount', methods=['GET'])
+@jsonify
+def company_headcount_view():
+    """
+    Returns number of present users on every date, optionally limited to
+    dates given as 'from' and 'to' arguments.
+    """
+    return get_company_stats(*get_date_range()).headcount_result()
+
+
+@app.route('/api/v1/occupancy', methods=['GET'])
+@jsonify
+def occupancy_view():
+    """
+    Returns number of present users in every 15 minute slot of every date,
+    optionally limited to dates given as 'from' and 'to' arguments.
+    """
+    return get_occupancy_index().dates_result(*get_date_range())
+
+
+@app.route('/api/v1/occupancy/weekday/<int:weekday>', methods=['GET'])
+@jsonify
+def occupancy_weekday_view(weekday):
+    """
+    Returns mean and maximum number of present users in every 15 minute slot
+    of given weekday (Monday is 0), optionally limited to dates given as
+    'from' and 'to' arguments.
+    """
+    if weekday > 6:
+        log.debug('Wrong weekday: %s', weekday)
+        abort(404)
+
+    return get_occupancy_index().weekday_result(weekday, *get_date_range())
+
+
+def report_versions():
+    """ Returns version of saved report, which report responses depend on. """
+    return [file_version(app.config['REPORT_FILE'])]
+
+
+@app.route('/api/v1/report', methods=['GET'])
+@jsonify_with(report_versions)
+def report_view():
+    """
+    Summary of saved overtime and anomalies report with totals of every
+    user. Weekly hours and anomalous rows are left to the user view.
+    """
+    report = get_report()
+    if report is None:
+        log.debug('Report %s not found!', app.config['REPORT_FILE'])
+        abort(404)
+
+    result = dict(report, users={})
+    for user_id, user in report['users'].iteritems():
+        totals = dict(user, anomalies=len(user['anomalies']))
+        del totals['weekly_hours']
+        result['users'][user_id] = totals
+    return result
+
+
+@app.route('/api/v1/report/<int:user_id>', methods=['GET'])
+@jsonify_with(report_versions)
+def user_report_view(user_id):
+    """ Overtime, weekly hours and anomalous rows of given user. """
+    report = get_report()
+    if report is None or str(user_id) not in report['users']:
+        log.debug('Report of user %s not found!', user_id)
+        abort(404)
+
+    return report['users'][str(user_id)]
+
+
+@app.route('/api/v1/_ready', methods=['GET'])
+def ready_view():
+    """
+    Readiness of the process: state and step timings of the warm-up. Status
+    is 503 until the warm-up finishes successfully.
+    """
+    return Response(dumps(WARMUP_STATUS.to_dict()),
+                    status=200 if WARMUP_STATUS.ready else 503,
+                    mimetype='application/json')
+
+
+METRICS_GAUGES = (
+    ('presence_analyzer_data_generation',
+     'Number of presence data loads and refreshes.', 'generation'),
+    ('presence_analyzer_rejected_lines',
+     'Number of presence CSV lines which could not be parsed.', 'rejected'),
+    ('presence_analyzer_duplicated_dates',
+     'Number of user dates present more than once in presence data.',
+     'duplicates'),
+)
+
+
+@app.route('/api/v1/_metrics', methods=['GET'])
+def metrics_view():
+    """
+    Timing histograms and gauges of data counters of the backend set as
+    PRESENCE_BACKEND in Prometheus text format.
+    """
+    counters = get_storage().counters()
+    return Response(render_metrics([
+        (name, documentation, counters[key])
+        for name, documentation, key in METRICS_GAUGES if key in counters
+    ]), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/static/mean_time_weekday.html', methods=['GET'])
 def mean_time_weekday_template_view():
     """ view using mean time template """
-    return render_template('mean_time_weekday.html', name='mako')
+    return render_page('mean_time_weekday.html')
 
 
 @app.route('/static/presence_weekday.html', methods=['GET'])
 def presence_weekday_template_view():
     """ view using presence template """
-    return render_template('presence_weekday.html', name='mako')
+    return render_page('presence_weekday.html')
 
 
 @app.route('/static/presence_start_end.html', methods=['GET'])
 def presence_start_end_template_view():  # pylint: disable=invalid-name
     """ view using presence start and template """
-    return render_template('presence_start_end.html', name='mako')
+    return render_page('presence_start_end.html')
 
 
 @app.route('/api/v1/pictures/<int:user_id>', methods=['GET'])
 @jsonify
 def user_picture_view(user_id):
     """ Returns mean presence time of given user grouped by weekday. """
-    data = get_users_from_xml()
-    if user_id not in data:
+    users = get_user_directory()
+    if user_id not in users:
         log.debug('User %s not found!', user_id)
         abort(404)
 
-    return data[int(user_id)].get('url')
+    return users.url(user_id)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Warm-up of presence analyzer at start.
+
+Loads presence data (with weekday stats of every user) and users directory,
+builds company-wide aggregates and optionally pre-renders JSON responses
+of the most requested endpoints into the response cache, so first requests
+find everything computed. Progress is reported by /api/v1/_ready.
+"""
+import logging
+import time
+
+from threading import Lock
+
+from presence_analyzer.backends import get_company_stats
+from presence_analyzer.backends import get_occupancy_index
+from presence_analyzer.backends import get_storage
+from presence_analyzer.main import app
+from presence_analyzer.utils import RESPONSE_CACHE
+from presence_analyzer.utils import get_user_directory
+
+
+LOG = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class WarmupStatus(object):
+    """ State and step timings of the last warm-up. """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.state = 'cold'
+        self.steps = []
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def ready(self):
+        """ Checks if the warm-up finished successfully. """
+        return self.state == 'ready'
+
+    def start(self):
+        """ Marks beginning of a warm-up. """
+        self.state = 'warming'
+        self.steps = []
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+
+    def finish(self, error=None):
+        """ Marks end of a warm-up, failed if error is given. """
+        self.state = 'failed' if error else 'ready'
+        self.error = error
+        self.finished = time.time()
+
+    def to_dict(self):
+        """ Returns status in readiness endpoint format. """
+        return {
+            'state': self.state,
+            'error': self.error,
+            'started': self.started,
+            'finished': self.finished,
+            'steps': [{'name': name, 'seconds': seconds}
+                      for name, seconds in self.steps],
+        }
+
+
+WARMUP_STATUS = WarmupStatus()
+
+
+def prerender_urls(user_ids):
+    """ Returns URLs of the most requested endpoints. """
+    urls = ['/api/v1/users']
+    urls.extend(
+        '/api/v1/company/{}'.format(endpoint)
+        for endpoint in ('mean_time_weekday', 'presence_start_end',
+                         'start_end_histogram', 'headcount')
+    )
+    for user_id in user_ids:
+        urls.extend(
+            '/api/v1/{}/{}'.format(endpoint, user_id)
+            for endpoint in ('mean_time_weekday', 'presence_weekday',
+                             'presence_start_end')
+        )
+    return urls
+
+
+def prerender(urls):
+    """
+    Requests given URLs, so their bodies land in the response cache.
+    Returns number of successful responses.
+    """
+    RESPONSE_CACHE.clear()
+    client = app.test_client()
+    return sum(1 for url in urls if client.get(url).status_code == 200)
+
+
+def warm_up(prerender_responses=None):
+    """
+    Loads data and builds aggregates in current process, step by step,
+    recording progress in WARMUP_STATUS. Columns of all users are built once
+    and shared by the following steps, except for the SQLite backend which
+    aggregates in the database. Responses are pre-rendered when
+    prerender_responses (WARMUP_PRERENDER by default) is set and the
+    response cache is enabled with JSON_RESPONSE_CACHE_SIZE.
+
+    Returns True if the warm-up succeeded. Errors of any step are logged and
+    mark the warm-up failed, they are never raised.
+    """
+    if prerender_responses is None:
+        prerender_responses = app.config['WARMUP_PRERENDER']
+    prerender_responses = (prerender_responses and
+                           app.config['JSON_RESPONSE_CACHE_SIZE'])
+
+    with WARMUP_STATUS.lock:
+        WARMUP_STATUS.start()
+        user_ids = []
+        steps = [
+            ('presence', lambda: get_storage().load()),
+            ('users', get_user_directory),
+            ('columns', lambda: user_ids.extend(get_storage().users())),
+            ('company', get_company_stats),
+            ('occupancy', get_occupancy_index),
+        ]
+        if prerender_responses:
+            steps.append(('responses',
+                          lambda: prerender(prerender_urls(user_ids))))
+
+        for name, step in steps:
+            started = time.time()
+            try:
+                step()
+            except Exception as error:  # pylint: disable=broad-except
+                LOG.warning('Warm-up step %s failed', name, exc_info=True)
+                WARMUP_STATUS.finish('{}: {}'.format(name, error))
+                return False
+            WARMUP_STATUS.steps.append((name, time.time() - started))
+
+        WARMUP_STATUS.finish()
+    LOG.info('Warm-up of %d users finished in %.3f s', len(user_ids),
+             WARMUP_STATUS.finished - WARMUP_STATUS.started)
+    return True
@@ -6,6 +6,9 @@ import os.path
 import logging.config
 
 from presence_analyzer.main import app
+from presence_analyzer.utils import set_users_locale
+from presence_analyzer.utils import start_users_refresher
+from presence_analyzer.warmup import warm_up
 import presence_analyzer.views
 
 
@@ -13,4 +16,9 @@ if __name__ == "__main__":
     ini_filename = os.path.join(os.path.dirname(__file__),
                                 '..', 'runtime', 'debug.ini')
     logging.config.fileConfig(ini_filename, disable_existing_loggers=False)
+    # with the reloader (in debug mode) only its child serves requests
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        set_users_locale()
+        warm_up()
+        start_users_refresher()
     app.run(host='0.0.0.0')